@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for the geometry kernels and the paint path.
+
+    python bench.py [-k PATTERN] [--max-size N] [--budget SECONDS]
+                    [-o RESULTS.json] [--baseline BASELINE.json]
+    python bench.py --compare BASELINE.json RESULTS.json
+
+Every benchmark sweeps one size (control points, samples or curves)
+over 10 to 10^5. A sweep stops once a call takes more than a tenth of
+the budget, as the next size is at least ten times the work, so the slow
+reference kernels do not run for hours. Each case records the best time
+per call over a few repeats, after one untimed call to fill caches.
+
+With --baseline or --compare, cases that got slower than the baseline
+by more than the threshold are reported as regressions and the exit
+status is 1.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from utils import (deCasteljau, deCasteljauRat, deCasteljauMany,
+                   deCasteljauRatMany, convex_hull, interpolate)
+from curve import Curve
+from bezier_spline import fit_cubics
+from rendering import ensureApplication
+
+SIZES = (10, 100, 1000, 10000, 100000)
+SAMPLES = 1000
+POINTS = 10
+PAINT_SIZE = (800, 600)
+CURVE_POINTS = 16
+
+
+def random_points(n, seed=0):
+    return np.random.RandomState(seed).rand(n, 2)
+
+
+def stroke_points(n, seed=0):
+    """Points along a wavy left-to-right stroke, like a drawn curve."""
+    state = np.random.RandomState(seed)
+    xs = np.linspace(0.05, 0.95, n)
+    ys = (0.5 + 0.3 * np.sin(seed + 6 * xs) +
+          0.05 * state.standard_normal(n))
+    return np.column_stack((xs, ys))
+
+
+def bench_deCasteljau(points, samples):
+    pts = [tuple(p) for p in random_points(points).tolist()]
+    ts = np.linspace(0.0, 1.0, samples).tolist()
+    return lambda: [deCasteljau(pts, t) for t in ts]
+
+
+def bench_deCasteljauRat(points, samples):
+    pts = [tuple(p) for p in random_points(points).tolist()]
+    ts = np.linspace(0.0, 1.0, samples).tolist()
+    weights = (0.5 + np.random.RandomState(1).rand(points)).tolist()
+    return lambda: [deCasteljauRat(pts, weights, t) for t in ts]
+
+
+def bench_deCasteljauMany(points, samples):
+    pts = random_points(points)
+    ts = np.linspace(0.0, 1.0, samples)
+    return lambda: deCasteljauMany(pts, ts)
+
+
+def bench_deCasteljauRatMany(points, samples):
+    pts = random_points(points)
+    weights = 0.5 + np.random.RandomState(1).rand(points)
+    ts = np.linspace(0.0, 1.0, samples)
+    return lambda: deCasteljauRatMany(pts, weights, ts)
+
+
+def bench_convex_hull(points):
+    pts = [tuple(p) for p in random_points(points).tolist()]
+    return lambda: convex_hull(pts)
+
+
+def bench_interpolate(points, samples):
+    ys = random_points(points)[:, 0]
+    xs = np.linspace(0.0, 1.0, samples)
+    return lambda: interpolate(1.0 / max(1, points - 1), ys, xs)
+
+
+def bench_fit_cubics(samples):
+    xs = np.linspace(0.05, 0.95, samples)
+    pts = np.column_stack((xs, 0.5 + 0.3 * np.sin(6 * xs)))
+    # Half a pixel of an 800 pixel wide board.
+    return lambda: fit_cubics(pts, 0.5 / PAINT_SIZE[0])
+
+
+def bench_make_plot(ctype, points):
+    curve = Curve(ctype)
+    for (x, y) in stroke_points(points).tolist():
+        curve.add_point(x, y)
+    (width, height) = PAINT_SIZE
+    # Each run nudges the middle point back or forth, so it times the
+    # plot after a one-point edit, with whatever the curve caches.
+    nudge = [1e-6]
+
+    def run():
+        curve.move_point_by(points // 2, nudge[0], 0.0)
+        nudge[0] = -nudge[0]
+        curve.make_plot(width, height)
+    return run
+
+
+def make_document(curves):
+    ctypes = ('bezier', 'nspline', 'pspline', 'interp')
+    document = {}
+    for i in range(curves):
+        curve = Curve(ctypes[i % len(ctypes)])
+        for (x, y) in stroke_points(CURVE_POINTS, seed=i).tolist():
+            curve.add_point(x, y)
+        document['curve {}'.format(i)] = curve
+    return document
+
+
+def bench_paint(curves, cached):
+    from PyQt5.QtGui import QImage
+    from communications import Communications
+    from drawing_board import DrawingBoard
+
+    ensureApplication(widgets=True)
+    board = DrawingBoard(None)
+    board.connectEvents(Communications())
+    board.resize(*PAINT_SIZE)
+    document = make_document(curves)
+    for curve in document.values():
+        curve.make_plot(*board.plotScale())
+    board.loadCurves(document)
+    image = QImage(board.size(), QImage.Format_ARGB32_Premultiplied)
+
+    def run():
+        if not cached:
+            board.backdrop = None
+        board.render(image)
+    # Keep the board alive as long as the benchmark is.
+    run.board = board
+    return run
+
+
+def bench_paint_points(points):
+    from PyQt5.QtGui import QImage
+    from communications import Communications
+    from drawing_board import DrawingBoard
+
+    ensureApplication(widgets=True)
+    board = DrawingBoard(None)
+    board.connectEvents(Communications())
+    board.resize(*PAINT_SIZE)
+    curve = Curve('nspline')
+    for (x, y) in stroke_points(points).tolist():
+        curve.add_point(x, y)
+    curve.make_plot(*board.plotScale())
+    board.loadCurves({'curve': curve})
+    image = QImage(board.size(), QImage.Format_ARGB32_Premultiplied)
+
+    def run():
+        # The plot is cached; this times drawing the curve and its points.
+        board.render(image)
+    run.board = board
+    return run
+
+
+# name, swept parameter, fixed parameters, setup
+BENCHMARKS = [
+    ('deCasteljau', 'points', {'samples': 100}, bench_deCasteljau),
+    ('deCasteljau', 'samples', {'points': POINTS}, bench_deCasteljau),
+    ('deCasteljauRat', 'points', {'samples': 100}, bench_deCasteljauRat),
+    ('deCasteljauRat', 'samples', {'points': POINTS}, bench_deCasteljauRat),
+    ('deCasteljauMany', 'points', {'samples': SAMPLES},
+     bench_deCasteljauMany),
+    ('deCasteljauMany', 'samples', {'points': POINTS},
+     bench_deCasteljauMany),
+    ('deCasteljauRatMany', 'points', {'samples': SAMPLES},
+     bench_deCasteljauRatMany),
+    ('deCasteljauRatMany', 'samples', {'points': POINTS},
+     bench_deCasteljauRatMany),
+    ('convex_hull', 'points', {}, bench_convex_hull),
+    ('interpolate', 'points', {'samples': SAMPLES}, bench_interpolate),
+    ('interpolate', 'samples', {'points': POINTS}, bench_interpolate),
+    ('fit_cubics', 'samples', {}, bench_fit_cubics),
+] + [
+    ('make_plot', 'points', {'ctype': ctype}, bench_make_plot)
+    for ctype in ('bezier', 'rbezier', 'bzspline', 'nspline', 'pspline',
+                  'interp')
+] + [
+    ('paint', 'curves', {'cached': False}, bench_paint),
+    ('paint', 'curves', {'cached': True}, bench_paint),
+    ('paint_points', 'points', {}, bench_paint_points),
+]
+
+
+def case_id(name, params):
+    return '/'.join([name] + ['{}={}'.format(key, params[key])
+                              for key in sorted(params)])
+
+
+def measure(function, repeat=3):
+    """Best seconds per call; calls are batched to last about 0.2 s."""
+    timer = timeit.Timer(function)
+    (number, _) = timer.autorange()
+    return (min(timer.repeat(repeat, number)) / number, number)
+
+
+def run_benchmarks(pattern='*', max_size=SIZES[-1], budget=1.0, log=None):
+    results = {}
+    for (name, param, fixed, setup) in BENCHMARKS:
+        for size in SIZES:
+            if size > max_size:
+                break
+            params = dict(fixed, **{param: size})
+            key = case_id(name, params)
+            if not fnmatch.fnmatchcase(key, pattern):
+                continue
+            function = setup(**params)
+            function()
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            if elapsed > budget:
+                (seconds, number) = (elapsed, 1)
+            else:
+                (seconds, number) = measure(function)
+            results[key] = {'name': name, 'params': params,
+                            'seconds': seconds, 'number': number}
+            if log is not None:
+                print('{:60} {:12.6f} s'.format(key, seconds), file=log)
+            if elapsed * 10 > budget:
+                break
+    return results
+
+
+def compare(baseline, results, threshold=0.25, log=None):
+    """Returns the ids of the cases more than threshold slower than in
+    the baseline."""
+    regressions = []
+    for key in sorted(set(baseline) & set(results)):
+        (old, new) = (baseline[key]['seconds'], results[key]['seconds'])
+        ratio = new / old if old > 0 else float('inf')
+        regressed = ratio > 1.0 + threshold
+        if regressed:
+            regressions.append(key)
+        if log is not None:
+            print('{:60} {:12.6f} {:12.6f} {:7.2f}x{}'.format(
+                key, old, new, ratio, '  REGRESSION' if regressed else ''),
+                file=log)
+    return regressions
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'system': platform.system(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the geometry kernels and the paint path.')
+    parser.add_argument('-k', '--pattern', default='*',
+                        help='only run cases whose id matches this glob')
+    parser.add_argument('--max-size', type=int, default=SIZES[-1])
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='longest call, in seconds, a sweep should '
+                             'reach')
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against these results')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'),
+                        help='only compare two result files')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        (baseline, results) = (load_results(path) for path in args.compare)
+    else:
+        baseline = load_results(args.baseline) if args.baseline else None
+        results = run_benchmarks(args.pattern, args.max_size, args.budget,
+                                 log=sys.stdout)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'environment': environment(), 'results': results},
+                          f, indent=1, sort_keys=True)
+    if baseline is None:
+        return 0
+    regressions = compare(baseline, results, args.threshold, log=sys.stdout)
+    if regressions:
+        print('{} regression(s)'.format(len(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
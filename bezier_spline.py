@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""Piecewise cubic Bézier curves.
+
+The control points P0, P1, ... form the cubic segments P0..P3, P3..P6,
+and so on. Every third point is a joint shared by two segments, the
+points on either side of it are its handles. Points that do not complete
+a segment yet form a last piece of lower degree, so the curve grows as
+points are added. The continuity at the joints is 'none', 'g1' (handles
+collinear) or 'c1' (handles mirrored).
+"""
+
+import numpy as np
+
+from utils import (deCasteljauMany, deCasteljauRatMany, subdivide,
+                   elevate_degree, bernstein_matrix)
+from tessellation import tessellate_many
+
+CONTINUITY = ('none', 'g1', 'c1')
+
+
+def split_segments(points):
+    """Control points of each segment, as views of points."""
+    n = len(points)
+    if n <= 4:
+        return [points]
+    return [points[i:i + 4] for i in range(0, n - 1, 3)]
+
+
+def cubic_segments(points):
+    """Control points of every segment as an (m, 4, 2) array; a last
+    piece of lower degree is raised to a cubic."""
+    n = len(points)
+    full = (n - 1) // 3 if n > 4 else int(n == 4)
+    cubics = points[3 * np.arange(full)[:, np.newaxis] + np.arange(4)]
+    if 3 * full < n - 1 or n == 1:
+        tail = points[3 * full:]
+        while len(tail) < 4:
+            tail = elevate_degree(tail)
+        cubics = np.concatenate((cubics, tail[np.newaxis]))
+    return cubics
+
+
+def tessellate_segments(points, scx, scy, cache):
+    """Samples the curve segment by segment.
+
+    cache maps the control points of a segment and the scale to its
+    parameters and samples, as returned by the previous call; the
+    segments not in it are tessellated together in one pass. Returns the
+    parameters, which run from k to k + 1 over segment k and are scaled
+    to [0, 1] as a whole, the samples and the cache to pass next time,
+    which holds just the current segments. cache itself is not changed.
+    """
+    cubics = cubic_segments(points)
+    keys = [(cubic.tobytes(), scx, scy) for cubic in cubics]
+    fresh = {key: cache[key] for key in keys if key in cache}
+    missing = [k for (k, key) in enumerate(keys) if key not in fresh]
+    if missing:
+        controls = cubics[missing]
+
+        def evaluate(ks, ts):
+            return np.einsum('ij,ijd->id', bernstein_matrix(3, ts),
+                             controls[ks])
+        plots = tessellate_many(evaluate, len(missing), scx, scy,
+                                segments=8)
+        for (k, plot) in zip(missing, plots):
+            fresh[keys[k]] = plot
+    (params, parts) = ([], [])
+    for (k, key) in enumerate(keys):
+        (ts, samples) = fresh[key]
+        params.append((ts[1:] if parts else ts) + k)
+        parts.append(samples[1:] if parts else samples)
+    return (np.concatenate(params) / len(keys), np.concatenate(parts),
+            fresh)
+
+
+def evaluate_segments(points, us):
+    """Points of the curve at parameters us, scaled as by
+    tessellate_segments."""
+    segments = split_segments(points)
+    us = np.asarray(us, dtype=np.float64) * len(segments)
+    ks = np.clip(np.floor(us).astype(int), 0, len(segments) - 1)
+    result = np.empty((len(us), 2))
+    for k in np.unique(ks).tolist():
+        mask = ks == k
+        result[mask] = deCasteljauMany(segments[k], us[mask] - k)
+    return result
+
+
+def align_handle(joint, handle, other, continuity):
+    """Where the other handle of a joint goes once handle has moved, or
+    None if it may stay."""
+    if continuity == 'c1':
+        return 2.0 * joint - handle
+    out = handle - joint
+    length = np.hypot(*out)
+    if continuity == 'g1' and length > 0:
+        return joint - out * (np.hypot(*(other - joint)) / length)
+    return None
+
+
+def linked_moves(points, i, old, continuity):
+    """New positions of the points that follow point i, which has just
+    moved from old.
+
+    A joint carries both its handles along; a handle turns (g1) or
+    mirrors (c1) the other handle of its joint.
+    """
+    n = len(points)
+    if i % 3 == 0:
+        delta = points[i] - np.asarray(old, dtype=np.float64)
+        return [(j, points[j] + delta) for j in (i - 1, i + 1) if 0 <= j < n]
+    (joint, other) = (i - 1, i - 2) if i % 3 == 1 else (i + 1, i + 2)
+    if other < 0 or other >= n:
+        return []
+    position = align_handle(points[joint], points[i], points[other],
+                            continuity)
+    return [] if position is None else [(other, position)]
+
+
+def enforce_continuity(points, continuity):
+    """New positions of the outgoing handles that make every joint meet
+    the continuity; the incoming handles stay."""
+    moves = []
+    for joint in range(3, len(points) - 1, 3):
+        position = align_handle(points[joint], points[joint - 1],
+                                points[joint + 1], continuity)
+        if position is not None:
+            moves.append((joint + 1, position))
+    return moves
+
+
+def bezier_to_cubics(points, weights=None, tolerance=1e-3,
+                     max_segments=1024):
+    """Approximates a (rational) Bézier curve of any degree by cubics.
+
+    Output: the control points of a C1 piecewise cubic curve, in the
+            layout described above.
+    Curves of degree three or less are converted exactly by degree
+    elevation. Higher degrees are split into 1, 2, 4, ... equal pieces
+    until every piece lies within tolerance of the cubic sharing its end
+    points and end derivatives.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) == 0:
+        return pts.copy()
+    ws = (np.ones(len(pts)) if weights is None
+          else np.asarray(weights, dtype=np.float64))
+    homogeneous = np.column_stack((pts * ws[:, np.newaxis], ws))
+    if len(pts) <= 4 and np.all(ws == ws[0]):
+        while len(homogeneous) < 4:
+            homogeneous = elevate_degree(homogeneous)
+        return homogeneous[:, :2] / homogeneous[:, 2:]
+    pieces = 1
+    while True:
+        (cubics, error) = _hermite_cubics(homogeneous, pieces)
+        if error <= tolerance or pieces >= max_segments:
+            break
+        pieces *= 2
+    return np.vstack([cubics[0]] + [cubic[1:] for cubic in cubics[1:]])
+
+
+def _hermite_cubics(homogeneous, pieces):
+    ts = np.linspace(0.0, 1.0, 17)
+    degree = len(homogeneous) - 1
+    cubics = []
+    error = 0.0
+    rest = homogeneous
+    for k in range(pieces):
+        if k < pieces - 1:
+            (piece, rest) = subdivide(rest, 1.0 / (pieces - k))
+        else:
+            piece = rest
+        ws = piece[:, 2]
+        pts = piece[:, :2] / ws[:, np.newaxis]
+        start = degree * ws[1] / ws[0] * (pts[1] - pts[0])
+        end = degree * ws[-2] / ws[-1] * (pts[-1] - pts[-2])
+        cubic = np.array([pts[0], pts[0] + start / 3.0,
+                          pts[-1] - end / 3.0, pts[-1]])
+        exact = deCasteljauRatMany(pts, ws, ts)
+        error = max(error, np.hypot(*(deCasteljauMany(cubic, ts) -
+                                      exact).T).max())
+        cubics.append(cubic)
+    return (cubics, error)
+
+
+def fit_cubics(points, tolerance, corners=(), reparameterize=4):
+    """Fits a piecewise cubic curve to a polyline.
+
+    Input: the points of the polyline, the distance the curve may stray
+           from them and the indices of the points where it may turn
+           sharply; elsewhere its joints are G1.
+    Output: the control points, in the layout described above.
+    Schneider's algorithm (Graphics Gems, 1990): a run of points is
+    fitted by one cubic through its end points, leaving them along fixed
+    tangents. The two handle lengths are solved by least squares over a
+    chord-length parametrisation, which is improved by a few Newton
+    steps when the fit is close. A run the cubic misses by more than
+    tolerance is split at the worst point, where both halves share one
+    tangent.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2:
+        return pts.copy()
+    # Tangents are taken towards points this far away, so that wiggles
+    # within the tolerance do not turn them.
+    reach = 4.0 * tolerance
+    bounds = sorted({0, len(pts) - 1} |
+                    {k for k in corners if 0 < k < len(pts) - 1})
+    cubics = []
+    # Runs still to fit as (first, last, start tangent, end tangent),
+    # the leftmost on top.
+    pending = [(i, j, _tangent(pts[i:j + 1], 0, 1, reach),
+                _tangent(pts[i:j + 1], j - i, -1, reach))
+               for (i, j) in reversed(list(zip(bounds, bounds[1:])))]
+    while pending:
+        (i, j, start, end) = pending.pop()
+        (cubic, split) = _fit_run(pts[i:j + 1], start, end, tolerance,
+                                  reparameterize)
+        if split is None:
+            cubics.append(cubic)
+            continue
+        k = i + split
+        tangent = _unit(_tangent(pts[i:j + 1], split, -1, reach) -
+                        _tangent(pts[i:j + 1], split, 1, reach))
+        pending.append((k, j, -tangent, end))
+        pending.append((i, k, start, tangent))
+    return np.vstack([cubics[0]] + [cubic[1:] for cubic in cubics[1:]])
+
+
+def _unit(vector):
+    length = np.hypot(*vector)
+    return vector / length if length > 0 else vector
+
+
+def _tangent(pts, k, direction, reach):
+    """Unit vector from pts[k] towards the first point reach away from
+    it in the given direction, or the last one there is."""
+    others = pts[k + direction::direction] if k + direction >= 0 else \
+        pts[:0]
+    if len(others) == 0:
+        return np.zeros(2)
+    far = np.flatnonzero(np.hypot(*(others - pts[k]).T) >= reach)
+    return _unit(others[far[0] if len(far) else -1] - pts[k])
+
+
+def _fit_run(pts, start, end, tolerance, reparameterize):
+    """The cubic fitted to pts and None, or the best cubic found and the
+    index to split pts at."""
+    (first, last) = (pts[0], pts[-1])
+    chord = np.hypot(*(last - first))
+    if len(pts) == 2:
+        return (np.array([first, first + start * chord / 3.0,
+                          last + end * chord / 3.0, last]), None)
+    lengths = np.concatenate(([0.0], np.cumsum(np.hypot(
+        *np.diff(pts, axis=0).T))))
+    if lengths[-1] == 0:
+        return (np.array([first] * 4), None)
+    us = lengths / lengths[-1]
+    for step in range(reparameterize + 1):
+        basis = _cubic_basis(us)
+        cubic = _handles(pts, basis, start, end)
+        offset = basis @ cubic - pts
+        errors = np.einsum('ij,ij->i', offset, offset)
+        worst = int(np.argmax(errors[1:-1])) + 1
+        if errors[worst] <= tolerance ** 2:
+            return (cubic, None)
+        if errors[worst] > 4 * tolerance ** 2 or step == reparameterize:
+            break
+        us = _newton_step(cubic, offset, us)
+    return (cubic, worst)
+
+
+def _cubic_basis(us):
+    vs = 1.0 - us
+    return np.column_stack((vs ** 3, 3.0 * us * vs ** 2, 3.0 * us ** 2 * vs,
+                            us ** 3))
+
+
+def _handles(pts, basis, start, end):
+    """Cubic from pts[0] to pts[-1] leaving along start and end whose
+    handle lengths fit the points at the parameters of basis best."""
+    (first, last) = (pts[0], pts[-1])
+    (b0, b1, b2, b3) = basis.T
+    rest = pts - np.outer(b0 + b1, first) - np.outer(b2 + b3, last)
+    # Normal equations of the least-squares problem in the handle
+    # lengths; start and end are unit vectors.
+    c11 = b1 @ b1
+    c12 = (b1 @ b2) * (start @ end)
+    c22 = b2 @ b2
+    r1 = b1 @ (rest @ start)
+    r2 = b2 @ (rest @ end)
+    det = c11 * c22 - c12 * c12
+    chord = np.hypot(*(last - first))
+    (alpha, beta) = (chord / 3.0, chord / 3.0)
+    if abs(det) > 1e-12 * c11 * c22:
+        fitted = ((r1 * c22 - r2 * c12) / det, (c11 * r2 - c12 * r1) / det)
+        # Handles of no or negative length leave the tangent undefined
+        # or reversed; Schneider falls back to a third of the chord.
+        if min(fitted) > 1e-6 * chord:
+            (alpha, beta) = fitted
+    return np.array([first, first + alpha * start, last + beta * end, last])
+
+
+def _newton_step(cubic, offset, us):
+    """Moves every parameter towards the point of cubic nearest to the
+    point offset away from the curve there."""
+    delta = np.diff(cubic, axis=0)
+    vs = 1.0 - us
+    d1 = 3.0 * (np.outer(vs ** 2, delta[0]) +
+                np.outer(2.0 * us * vs, delta[1]) +
+                np.outer(us ** 2, delta[2]))
+    d2 = 6.0 * (np.outer(vs, delta[1] - delta[0]) +
+                np.outer(us, delta[2] - delta[1]))
+    numerator = np.einsum('ij,ij->i', offset, d1)
+    denominator = (np.einsum('ij,ij->i', d1, d1) +
+                   np.einsum('ij,ij->i', offset, d2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(denominator != 0, numerator / denominator, 0.0)
+    return np.clip(us - step, 0.0, 1.0)
@@ -1,11 +1,40 @@
 # -*- coding: utf-8 -*-
 
-from PyQt5.QtCore import pyqtSignal, QObject
+from collections import defaultdict
+
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+
+
+class ChangeSet:
+    """Changes to the board's curves made during one event-loop pass.
+
+    points and fields map a curve name to the indices of its points and
+    the names of its fields ('points', 'weights', 'ctype', 'shape',
+    'hull', 'guide', 'curves') that changed. curves is the board's curve
+    mapping and selection its (active curve, selected point) as of the
+    last change; listeners read current values from them.
+    """
+
+    def __init__(self):
+        self.points = defaultdict(set)
+        self.fields = defaultdict(set)
+        self.curves = {}
+        self.selection = (None, None)
+
+    def add(self, cname, points=(), fields=()):
+        self.points[cname].update(points)
+        self.fields[cname].update(fields)
+
+    def touches(self, cname, *fields):
+        return not self.fields.get(cname, set()).isdisjoint(fields)
+
+    def point_changed(self, cname, i):
+        return i in self.points.get(cname, ())
 
 
 class Communications(QObject):
     updateStatusBar = pyqtSignal(str)
-    updateSelectedPoint = pyqtSignal(str, str, str)
+    modelChanged = pyqtSignal(object)
     cyclePoint = pyqtSignal(int)
     gotoPoint = pyqtSignal(int)
     reorderPoint = pyqtSignal(int)
@@ -15,8 +44,34 @@ class Communications(QObject):
     moveYPointTo = pyqtSignal(int)
     toggleHull = pyqtSignal(bool)
     toggleGuide = pyqtSignal(bool)
+    toggleWeights = pyqtSignal(bool)
+    changeWeight = pyqtSignal(float)
     addCurve = pyqtSignal(str)
     removeCurve = pyqtSignal(str)
+    curveRemoved = pyqtSignal(str)
+    curveRenamed = pyqtSignal(str, str)
     selectCurve = pyqtSignal(str)
     selectedCurveName = pyqtSignal(str)
     renameCurve = pyqtSignal(str)
+
+    # Milliseconds between two modelChanged signals; 0 sends the changes
+    # collected so far on the next pass of the event loop.
+    notifyInterval = 0
+
+    def __init__(self):
+        super().__init__()
+        self.changes = None
+
+    def notify(self, curves, selection, cname, points=(), fields=()):
+        """Adds a change to the set modelChanged delivers next."""
+        if self.changes is None:
+            self.changes = ChangeSet()
+            QTimer.singleShot(self.notifyInterval, self.deliver)
+        self.changes.curves = curves
+        self.changes.selection = selection
+        self.changes.add(cname, points, fields)
+
+    def deliver(self):
+        (changes, self.changes) = (self.changes, None)
+        if changes is not None:
+            self.modelChanged.emit(changes)
@@ -1,76 +1,556 @@
-from utils import (deCasteljau, deCasteljauRat, convex_hull)
-from PyQt5.QtCore import QPointF
+import copy
+import time
+import numpy as np
+from utils import (deCasteljauMany, deCasteljauRatMany)
+from hull import DynamicHull
+from spline import (spline_moments, evaluate_spline)
+from interpolation import BarycentricInterpolator
+from spatial_index import PointGrid
+from tessellation import (chord_deviation, tessellate)
+from bezier_spline import (tessellate_segments, evaluate_segments,
+                           linked_moves, enforce_continuity, bezier_to_cubics)
+from metrics import metrics
 from PyQt5.QtGui import QPolygonF
 
 
+HULL_BOUNDED = ('bezier', 'rbezier', 'bzspline')
+INTERP_SAMPLES = 1 << 14
+# Tessellation starts from a piece per this many pixels of the control
+# polygon, if that is fewer than two per point.
+SEED_PIXELS = 16
+
+
 class Curve:
+    __slots__ = ('name', 'ctype', 'points_no', '_points', '_weights',
+                 'is_changed', 'is_hull', 'is_guide', 'version',
+                 'plot', 'samples', 'plot_version', 'hull', 'guide',
+                 'dynamic_hull', 'point_grid', 'interpolator', 'plot_time',
+                 'continuity', 'segment_cache', 'plot_scale', 'bbox',
+                 'params', 'arc', 'evaluate')
+
     def __init__(self, ctype, name=''):
         self.name = name
-        self.points = []
         self.points_no = 0
+        # Control points and weights live in preallocated arrays that
+        # double when full; points and weights are views of the used part.
+        self._points = np.empty((8, 2))
+        self._weights = np.empty(8)
         self.ctype = ctype
-        self.is_changed = True
+        self.continuity = 'c1'
         self.is_hull = False
         self.is_guide = False
-        self.plot = None
+        self.reset_caches()
+
+    def reset_caches(self):
+        self.is_changed = True
+        self.version = 0
+        self.plot = QPolygonF()
+        self.samples = np.empty((0, 2))
+        self.params = np.empty(0)
+        self.evaluate = None
+        self.arc = None
+        self.plot_version = 0
+        self.plot_time = 0.0
+        self.plot_scale = None
+        self.bbox = None
         self.hull = None
         self.guide = None
+        self.dynamic_hull = None
+        self.point_grid = PointGrid()
+        for (i, point) in enumerate(self.points.tolist()):
+            self.point_grid.insert(i, point)
+        self.interpolator = BarycentricInterpolator()
+        self.segment_cache = {}
+
+    def __getstate__(self):
+        return {'name': self.name, 'ctype': self.ctype,
+                'is_hull': self.is_hull, 'is_guide': self.is_guide,
+                'continuity': self.continuity,
+                'points': self.points.copy(), 'weights': self.weights.copy()}
+
+    def __setstate__(self, state):
+        (self.name, self.ctype) = (state['name'], state['ctype'])
+        (self.is_hull, self.is_guide) = (state['is_hull'], state['is_guide'])
+        self.continuity = state.get('continuity', 'c1')
+        self.points_no = len(state['points'])
+        self._points = np.array(state['points'], dtype=np.float64
+                                ).reshape(-1, 2)
+        self._weights = np.array(state['weights'], dtype=np.float64)
+        self.reset_caches()
+
+    @classmethod
+    def from_state(cls, state):
+        curve = cls.__new__(cls)
+        curve.__setstate__(state)
+        return curve
+
+    @classmethod
+    def from_arrays(cls, ctype, points, weights, name=''):
+        return cls.from_state({'name': name, 'ctype': ctype,
+                               'is_hull': False, 'is_guide': False,
+                               'points': points, 'weights': weights})
+
+    @property
+    def points(self):
+        return self._points[:self.points_no]
+
+    @property
+    def weights(self):
+        return self._weights[:self.points_no]
 
     def add_point(self, x, y, z=0):
-        self.points.append((x, y))
+        if self.points_no == len(self._points):
+            capacity = max(8, 2 * len(self._points))
+            self._points = np.resize(self._points, (capacity, 2))
+            self._weights = np.resize(self._weights, capacity)
+        i = self.points_no
+        self._points[i] = (x, y)
+        self._weights[i] = 1.0
         self.points_no += 1
-        self.is_changed = True
+        self.point_grid.insert(i, (x, y))
+        if self.dynamic_hull is not None:
+            self.dynamic_hull.add(self.points, i)
+        if self.ctype == 'bzspline' and i % 3 == 1:
+            # A new handle behaves as if it was dragged into place.
+            self.move_linked(i, (x, y))
+        self.touch()
+
+    def remove_point(self, i):
+        """Deletes point i; the last one goes without rebuilding the
+        point grid or hull."""
+        last = self.points_no - 1
+        old = tuple(self._points[i].tolist())
+        self._points[i:last] = self._points[i + 1:last + 1]
+        self._weights[i:last] = self._weights[i + 1:last + 1]
+        self.points_no = last
+        if i == last:
+            self.point_grid.remove(i, old)
+        else:
+            self.point_grid = PointGrid()
+            for (j, point) in enumerate(self.points.tolist()):
+                self.point_grid.insert(j, point)
+        if self.dynamic_hull is not None and (
+                i != last or i in self.dynamic_hull.members):
+            self.dynamic_hull.rebuild(self.points)
+        # The knots are 0, ..., n - 1 whichever point went.
+        if len(self.interpolator.nodes) > self.points_no:
+            self.interpolator.remove_node()
+        self.touch()
+
+    def linked_span(self, i):
+        """Indices of the points an edit of point i may move."""
+        if self.ctype == 'bzspline':
+            return range(max(i - 2, 0), min(i + 3, self.points_no))
+        return range(i, min(i + 1, self.points_no))
 
     def move_point_to(self, i, x=None, y=None):
-        (old_x, old_y) = self.points[i]
-        self.points[i] = (x if x is not None else old_x,
-                          y if y is not None else old_y)
-        self.is_changed = True
+        old = tuple(self._points[i].tolist())
+        self._points[i] = (x if x is not None else old[0],
+                           y if y is not None else old[1])
+        self.point_moved(i, old)
 
     def move_point_by(self, i, dx, dy):
-        (x, y) = self.points[i]
-        self.points[i] = (x + dx, y + dy)
+        old = tuple(self._points[i].tolist())
+        self._points[i] += (dx, dy)
+        self.point_moved(i, old)
+
+    def point_moved(self, i, old):
+        self.point_placed(i, old)
+        if self.ctype == 'bzspline':
+            self.move_linked(i, old)
+        self.touch()
+
+    def point_placed(self, i, old):
+        self.point_grid.move(i, old, tuple(self._points[i].tolist()))
+        if self.dynamic_hull is not None:
+            self.dynamic_hull.move(self.points, i, old)
+
+    def place_points(self, moves):
+        for (j, position) in moves:
+            old = tuple(self._points[j].tolist())
+            self._points[j] = position
+            self.point_placed(j, old)
+
+    def place_many(self, indices, positions):
+        """Puts the points at indices at positions in one go."""
+        indices = np.asarray(indices, dtype=np.intp)
+        old = self._points[indices].tolist()
+        self._points[indices] = np.reshape(positions, (-1, 2))
+        for (i, before, after) in zip(indices.tolist(), old,
+                                      self._points[indices].tolist()):
+            self.point_grid.move(i, before, after)
+        if self.dynamic_hull is not None:
+            if len(indices) == 1:
+                self.dynamic_hull.move(self.points, indices[0], old[0])
+            else:
+                # One rebuild when the hull is next shown beats updating
+                # it point by point.
+                self.dynamic_hull = None
+
+    def restore_points(self, indices, positions):
+        """Puts points back without dragging their neighbours along."""
+        self.place_many(indices, positions)
+        self.touch()
+
+    def carried(self, indices):
+        """The points at indices, with the handles of Bézier spline
+        joints among them."""
+        moved = set(indices)
+        if self.ctype == 'bzspline':
+            for i in indices:
+                if i % 3 == 0:
+                    moved.update(j for j in (i - 1, i + 1)
+                                 if 0 <= j < self.points_no)
+        return moved
+
+    def lone_handles(self, moved):
+        """Moved handles whose joint stays; they turn the joint's other
+        handle unless that one moves too."""
+        if self.ctype != 'bzspline' or self.continuity == 'none':
+            return []
+        lone = []
+        for i in moved:
+            if i % 3 == 0:
+                continue
+            (joint, other) = (i - 1, i - 2) if i % 3 == 1 else (i + 1, i + 2)
+            if (joint not in moved and 0 <= other < self.points_no and
+                    other not in moved):
+                lone.append((i, other))
+        return lone
+
+    def transform_span(self, indices):
+        """Indices of all the points transform_points(indices) changes."""
+        moved = self.carried(indices)
+        return sorted(moved.union(other for (_, other)
+                                  in self.lone_handles(moved)))
+
+    def transform_points(self, indices, matrix):
+        """Maps the points at indices by the affine matrix
+        [[a, b, tx], [c, d, ty]], all at once."""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        moved = self.carried(indices)
+        span = np.fromiter(sorted(moved), dtype=np.intp, count=len(moved))
+        self.place_many(span, self._points[span] @ matrix[:, :2].T +
+                        matrix[:, 2])
+        for (i, _) in self.lone_handles(moved):
+            self.move_linked(i, self.points[i])
+        self.touch()
+
+    def move_linked(self, i, old):
+        self.place_points(linked_moves(self.points, i, old, self.continuity))
+
+    def set_continuity(self, continuity):
+        self.continuity = continuity
+        if self.ctype == 'bzspline':
+            self.place_points(enforce_continuity(self.points, continuity))
+            self.touch()
+
+    def convert_to_bezier_spline(self, tolerance=1e-3):
+        """Replaces a Bézier curve by C1 cubic segments tracing it."""
+        weights = self.weights if self.ctype == 'rbezier' else None
+        points = bezier_to_cubics(self.points, weights, tolerance)
+        self.set_shape({'ctype': 'bzspline', 'continuity': 'c1',
+                        'points': points, 'weights': np.ones(len(points))})
+
+    def shape(self):
+        """The type, continuity, points and weights, copied."""
+        return {'ctype': self.ctype, 'continuity': self.continuity,
+                'points': self.points.copy(), 'weights': self.weights.copy()}
+
+    def set_shape(self, shape):
+        """Replaces what shape() returns, keeping name and overlays."""
+        (self.ctype, self.continuity) = (shape['ctype'], shape['continuity'])
+        self._points = np.array(shape['points'], dtype=np.float64
+                                ).reshape(-1, 2)
+        self._weights = np.array(shape['weights'], dtype=np.float64)
+        self.points_no = len(self._points)
+        self.point_grid = PointGrid()
+        for (i, point) in enumerate(self.points.tolist()):
+            self.point_grid.insert(i, point)
+        self.dynamic_hull = None
+        self.interpolator = BarycentricInterpolator()
+        self.segment_cache = {}
+        self.touch()
+
+    def set_weight(self, i, weight):
+        self._weights[i] = weight
+        self.touch()
+
+    def set_rational(self, is_rational):
+        """Switches a Bézier curve between plain and weighted evaluation;
+        the weights are kept either way."""
+        self.ctype = 'rbezier' if is_rational else 'bezier'
+        self.touch()
+
+    def touch(self):
+        """Marks the plot as out of date after an edit."""
         self.is_changed = True
+        self.version += 1
+        self.hull = None
+        self.guide = None
+        self.bbox = None
+        self.arc = None
 
     def make_plot(self, scx, scy):
-        if self.is_changed:
-            if self.is_hull:
-                self.make_hull(scx, scy)
-            if self.is_guide:
-                self.make_guide(scx, scy)
-            plot_size = 100. + 10. * self.points_no
-            if self.ctype == 'bezier' and self.points_no > 0:
-                points = [deCasteljau(self.points, t / plot_size)
-                          for t in range(int(plot_size + 1))]
-            elif self.ctype == 'rbezier' and self.points_no > 0:
-                points = [deCasteljauRat(self.points, self.weights,
-                                         t / plot_size)
-                          for t in range(int(plot_size + 1))]
-            else:
-                points = []
-            self.plot = QPolygonF()
-            for (x, y) in points:
-                self.plot.append(QPointF(scx * x + 5, scy * y + 5))
+        """Brings the cached plot, hull and guide up to date.
+
+        They are kept in model coordinates; scx and scy only tell the
+        tessellator how many pixels a unit spans on screen.
+        """
+        if self.needs_plot(scx, scy):
+            self.set_plot(self.prepare_plot(scx, scy)())
+        self.make_overlays()
+
+    def needs_plot(self, scx, scy):
+        """Whether the plot is out of date or was sampled for another
+        zoom level."""
+        return self.is_changed or self.plot_scale != (scx, scy)
+
+    def prepare_plot(self, scx, scy):
+        """Returns a function computing plot samples for the current points.
+
+        The function works on a snapshot of the curve, so it can run in
+        another thread while the curve keeps being edited.
+        """
+        self.plot_scale = (scx, scy)
+        points = self.points.copy()
+        if self.ctype == 'bzspline' and self.points_no > 0:
+            cache = dict(self.segment_cache)
+
+            def compute():
+                (ts, samples, fresh) = tessellate_segments(points, scx, scy,
+                                                           cache)
+                return (ts, samples,
+                        lambda us: evaluate_segments(points, us), fresh)
+            return self.timed_job(compute)
+        evaluator = self.evaluator(points)
+        if evaluator is None:
+            return lambda: (np.empty(0), np.empty((0, 2)), None, None)
+        seeds = 16 + 2 * self.points_no
+        # Interpolating polynomials through many points swing out by
+        # orders of magnitude, where no sampling would be fine enough.
+        max_samples = INTERP_SAMPLES if self.ctype == 'interp' else None
+
+        def compute():
+            # Starting from two pieces per point finds the wiggles between
+            # them but costs samples in proportion to the points. Curves
+            # short on screen start from fewer pieces, checked against the
+            # points and midpoints those pieces would have had.
+            polygon = np.hypot(*(np.diff(points, axis=0) * (scx, scy)).T).sum()
+            segments = 16 + int(polygon / SEED_PIXELS)
+            (segments, probes) = ((seeds, None) if segments >= seeds else
+                                  (segments, 2 * seeds))
+            evaluate = evaluator()
+            return tessellate(evaluate, scx, scy, segments=segments,
+                              max_samples=max_samples,
+                              probes=probes) + (evaluate, None)
+        return self.timed_job(compute)
+
+    def evaluator(self, points):
+        """Returns a function setting up the evaluation of the curve
+        through points, which returns the function mapping parameters
+        to curve points. The setup may run in another thread."""
+        if self.points_no == 0:
+            return None
+        if self.ctype == 'bezier':
+            return lambda: lambda ts: deCasteljauMany(points, ts)
+        if self.ctype == 'rbezier':
+            weights = self.weights.copy()
+            return lambda: lambda ts: deCasteljauRatMany(points, weights, ts)
+        if self.ctype == 'bzspline':
+            return lambda: lambda ts: evaluate_segments(points, ts)
+        if self.ctype in ('nspline', 'pspline'):
+            periodic = self.ctype == 'pspline'
+
+            def evaluator():
+                moments = spline_moments(points, periodic)
+                return lambda ts: evaluate_spline(points, moments, ts,
+                                                  periodic)
+            return evaluator
+        if self.ctype == 'interp':
+            # Knots sit at 0, 1, ..., n - 1; only new points add nodes,
+            # moving a point leaves the weights as they are.
+            for x in range(len(self.interpolator.nodes), self.points_no):
+                self.interpolator.add_node(x)
+            interpolator = copy.copy(self.interpolator)
+            knots = self.points_no - 1
+            return lambda: lambda ts: interpolator.evaluate(points,
+                                                            knots * ts)
+        return None
+
+    def timed_job(self, compute):
+        ctype = self.ctype
+
+        def job():
+            start = time.perf_counter()
+            plot = compute()
+            self.plot_time = time.perf_counter() - start
+            metrics.count('tessellations')
+            metrics.hit('plot', False)
+            metrics.add_time('tessellate.' + ctype, self.plot_time)
+            return plot
+        return job
+
+    def set_plot(self, plot):
+        """Installs the parameters, samples and evaluator a plot job
+        returned, and the segment cache of a Bézier spline's job."""
+        (self.params, self.samples, self.evaluate, cache) = plot
+        if cache is not None:
+            self.segment_cache = cache
+        self.plot = to_polygon(self.samples)
+        self.plot_version += 1
         self.is_changed = False
+        self.bbox = None
+        self.arc = None
+
+    def arc_table(self):
+        """Cumulative arc length at every sample of the plot, with the
+        plot parameters and an evaluator of the curve.
 
-    def make_hull(self, scx, scy):
-        conv = convex_hull(self.points)
-        self.hull = QPolygonF()
-        for (x, y) in conv:
-            self.hull.append(QPointF(scx * x + 5, scy * y + 5))
+        Built on first use after every new plot or edit, from the plot
+        at hand and the evaluator its job set up, so queries cost
+        neither a tessellation nor a spline solve.
+        """
+        if self.arc is None:
+            steps = np.hypot(*np.diff(self.samples, axis=0).T)
+            lengths = np.concatenate(([0.0], np.cumsum(steps)))
+            self.arc = (lengths, self.params, self.evaluate)
+        return self.arc
 
-    def make_guide(self, scx, scy):
-        self.guide = QPolygonF()
-        for (x, y) in self.points:
-            self.guide.append(QPointF(scx * x + 5, scy * y + 5))
+    def length(self):
+        lengths = self.arc_table()[0]
+        return float(lengths[-1]) if len(lengths) else 0.0
+
+    def parameter_at(self, distance):
+        """Parameter of the point distance along the curve from its
+        start, found by binary search in the arc length table; takes
+        a number or an array."""
+        (lengths, ts, _) = self.arc_table()
+        if len(lengths) < 2:
+            return np.zeros_like(np.asarray(distance, dtype=np.float64))
+        distance = np.clip(distance, 0.0, lengths[-1])
+        k = np.clip(np.searchsorted(lengths, distance, side='right') - 1,
+                    0, len(lengths) - 2)
+        span = lengths[k + 1] - lengths[k]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.where(span > 0, (distance - lengths[k]) / span, 0.0)
+        return ts[k] + s * (ts[k + 1] - ts[k])
+
+    def point_at_length(self, distance):
+        evaluate = self.arc_table()[2]
+        return evaluate(np.atleast_1d(self.parameter_at(distance)))
+
+    def project(self, x, y, scx=1.0, scy=1.0, segments=None, steps=3):
+        """The point of the curve closest to (x, y).
+
+        Output: (parameter, (px, py), distance, arc length up to it) or
+                None for a curve without a plot; distance is measured
+                after scaling by scx and scy, e.g. in pixels.
+        The closest point of the plot, or of the given plot segments
+        only, is refined by a few Newton steps on the curve itself.
+        """
+        (lengths, ts, evaluate) = self.arc_table()
+        samples = self.samples
+        if len(samples) == 0 or evaluate is None:
+            return None
+        scale = np.array([scx, scy], dtype=np.float64)
+        cursor = np.array([x, y], dtype=np.float64) * scale
+        if len(samples) == 1:
+            ks = np.zeros(1, dtype=int)
+            (a, b) = (samples * scale, samples * scale)
+        else:
+            ks = (np.arange(len(samples) - 1) if segments is None else
+                  np.asarray([k for k in segments if k < len(samples) - 1],
+                             dtype=int))
+            if len(ks) == 0:
+                return None
+            (a, b) = (samples[ks] * scale, samples[ks + 1] * scale)
+        nearest = int(np.argmin(chord_deviation(a, b, cursor[np.newaxis])))
+        k = ks[nearest]
+        ab = b[nearest] - a[nearest]
+        length2 = ab @ ab
+        s = 0.0 if length2 == 0 else min(max(
+            (cursor - a[nearest]) @ ab / length2, 0.0), 1.0)
+        last = len(ts) - 1
+        (lo, hi) = (ts[max(k - 1, 0)], ts[min(k + 2, last)])
+        t = ts[k] + s * (ts[min(k + 1, last)] - ts[k])
+        # Newton's method on the derivative of the squared distance; the
+        # derivatives come from differences kept inside [0, 1].
+        h = 1e-5
+        for _ in range(steps):
+            center = min(max(t, h), 1.0 - h)
+            (p, before, middle, after) = evaluate(
+                np.array([t, center - h, center, center + h])) * scale
+            d1 = (after - before) / (2 * h)
+            d2 = (after - 2 * middle + before) / (h * h)
+            slope = d1 @ (p - cursor)
+            curvature = d2 @ (p - cursor) + d1 @ d1
+            if curvature <= 0:
+                break
+            t = min(max(t - slope / curvature, lo), hi)
+        point = evaluate(np.array([t]))[0]
+        distance = float(np.hypot(*(point * scale - cursor)))
+        along = lengths[k] + float(np.hypot(*(point - samples[k])))
+        return (float(t), tuple(point.tolist()), distance, along)
+
+    def bounds(self):
+        """Bounding box (x0, y0, x1, y1) of the curve.
+
+        Bézier curves lie in the convex hull of their control points, so
+        those are enough; interpolating curves may overshoot them and
+        their plot is taken into account as well.
+        """
+        if self.bbox is None:
+            covered = self.points
+            if self.ctype not in HULL_BOUNDED:
+                covered = np.vstack((covered, self.samples))
+            if len(covered) == 0:
+                self.bbox = (np.inf, np.inf, -np.inf, -np.inf)
+            else:
+                self.bbox = (tuple(covered.min(axis=0).tolist()) +
+                             tuple(covered.max(axis=0).tolist()))
+        return self.bbox
+
+    def make_overlays(self):
+        if self.is_hull and self.hull is None:
+            self.make_hull()
+        if self.is_guide and self.guide is None:
+            self.make_guide()
+
+    def make_hull(self):
+        if self.dynamic_hull is None:
+            self.dynamic_hull = DynamicHull(self.points)
+        self.hull = to_polygon(self.points[self.dynamic_hull.vertices])
+
+    def make_guide(self):
+        self.guide = to_polygon(self.points)
+
+    def point_at(self, x, y, scx, scy, radius):
+        return self.point_grid.nearest(self.points, x, y, scx, scy, radius)
 
     def toggle_hull(self, is_hull):
         self.is_hull = is_hull
-        self.is_changed = True
+        if not is_hull:
+            # Stop paying for hull updates while it is not shown.
+            self.dynamic_hull = None
 
     def toggle_guide(self, is_guide):
         self.is_guide = is_guide
-        self.is_changed = True
 
     def rename(self, new_name):
         self.name = new_name
+
+
+def to_polygon(points):
+    """Copies an (n, 2) float64 array into a QPolygonF in one go.
+
+    QPointF is two packed doubles, so the polygon's storage has the
+    same layout as the array and is filled through its buffer.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = QPolygonF(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(points.nbytes)
+        np.frombuffer(buffer, dtype=np.float64)[:] = points.ravel()
+    return polygon
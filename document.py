@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""Binary curve documents.
+
+Layout, all little-endian:
+
+    header   magic b'CRVD', format version, reserved, curve count,
+             index of the active curve (0xFFFFFFFF for none)
+    index    one entry per curve: data offset, point count, flags
+             (display, weights and Bézier spline continuity), bounding
+             box of the control points, name and type
+    data     per curve, 8-byte aligned: points as float64 (x, y) pairs,
+             then one float64 weight per point if FLAG_WEIGHTS is set
+
+Only the control points, weights, type, name and display flags are
+stored; plots are recomputed after loading.
+"""
+
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from curve import Curve
+
+MAGIC = b'CRVD'
+VERSION = 1
+NO_ACTIVE = 0xFFFFFFFF
+
+FLAG_HULL = 1
+FLAG_GUIDE = 2
+FLAG_WEIGHTS = 4
+FLAG_G1 = 8
+FLAG_C1 = 16
+
+_HEADER = struct.Struct('<4sHHII')
+_ENTRY = struct.Struct('<QIBB4d')
+_NAME = struct.Struct('<H')
+_CTYPE = struct.Struct('<B')
+
+
+class DocumentError(Exception):
+    pass
+
+
+def save_document(path, curves, active=None):
+    """Writes the curves to path, replacing the file atomically."""
+    names = list(curves)
+    records = []
+    for name in names:
+        curve = curves[name]
+        flags = ((FLAG_HULL if curve.is_hull else 0) |
+                 (FLAG_GUIDE if curve.is_guide else 0) |
+                 _CONTINUITY_FLAGS[curve.continuity])
+        points = np.ascontiguousarray(curve.points, dtype='<f8')
+        weights = np.ascontiguousarray(curve.weights, dtype='<f8')
+        if len(points) and np.any(weights != 1.0):
+            flags |= FLAG_WEIGHTS
+        if len(points):
+            bounds = tuple(points.min(axis=0)) + tuple(points.max(axis=0))
+        else:
+            bounds = (0.0, 0.0, 0.0, 0.0)
+        records.append((name, curve.ctype, flags, points, weights, bounds))
+
+    index_size = sum(_ENTRY.size + _NAME.size + len(name.encode('utf-8')) +
+                     _CTYPE.size + len(ctype.encode('ascii'))
+                     for (name, ctype, _, _, _, _) in records)
+    offset = _align(_HEADER.size + index_size)
+    index = []
+    for (name, ctype, flags, points, weights, bounds) in records:
+        index.append(offset)
+        offset = _align(offset + points.nbytes +
+                        (weights.nbytes if flags & FLAG_WEIGHTS else 0))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        active_index = names.index(active) if active in names else NO_ACTIVE
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(records), active_index))
+        for ((name, ctype, flags, points, _, bounds), offset) in zip(records,
+                                                                     index):
+            encoded = name.encode('utf-8')
+            f.write(_ENTRY.pack(offset, len(points), flags, 0, *bounds))
+            f.write(_NAME.pack(len(encoded)) + encoded)
+            f.write(_CTYPE.pack(len(ctype)) + ctype.encode('ascii'))
+        for ((_, _, flags, points, weights, _), offset) in zip(records, index):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(points.tobytes())
+            if flags & FLAG_WEIGHTS:
+                f.write(weights.tobytes())
+    os.replace(tmp_path, path)
+
+
+_CONTINUITY_FLAGS = {'none': 0, 'g1': FLAG_G1, 'c1': FLAG_C1}
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class LazyCurves(MutableMapping):
+    """Curves of a document, decoded from a memory map on first access.
+
+    Opening a document only reads its index; each curve's arrays are
+    copied out of the map the first time the curve is looked up. The map
+    is closed once every curve has been decoded.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # mmap refuses empty files.
+                raise DocumentError('{} is not a curve document'.format(path))
+        self.entries = {}
+        self.decoded = {}
+        self.order = {}
+        try:
+            self.active = self._read_index(path)
+        except (struct.error, UnicodeDecodeError, DocumentError) as e:
+            self.map.close()
+            self.map = None
+            if isinstance(e, DocumentError):
+                raise
+            raise DocumentError('{} is truncated or damaged'.format(path))
+
+    def _read_index(self, path):
+        """Reads the header and index, checking that every curve's data
+        lies within the file; returns the name of the active curve."""
+        (magic, version, _, count, active) = _HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise DocumentError('{} is not a curve document'.format(path))
+        if version > VERSION:
+            raise DocumentError('{} needs a newer version of the editor '
+                                '(format {})'.format(path, version))
+        size = len(self.map)
+        pos = _HEADER.size
+        for _ in range(count):
+            (offset, points_no, flags, _, *bounds) = _ENTRY.unpack_from(
+                self.map, pos)
+            pos += _ENTRY.size
+            (name, pos) = self._read_string(_NAME, pos, 'utf-8')
+            (ctype, pos) = self._read_string(_CTYPE, pos, 'ascii')
+            nbytes = 16 * points_no + (8 * points_no
+                                       if flags & FLAG_WEIGHTS else 0)
+            if offset + nbytes > size:
+                raise struct.error('data of {} past the end'.format(name))
+            self.entries[name] = (offset, points_no, flags, ctype,
+                                  tuple(bounds))
+            self.order[name] = None
+        names = list(self.order)
+        return names[active] if active < len(names) else None
+
+    def _read_string(self, prefix, pos, encoding):
+        (length,) = prefix.unpack_from(self.map, pos)
+        pos += prefix.size
+        if pos + length > len(self.map):
+            raise struct.error('string past the end')
+        return (self.map[pos:pos + length].decode(encoding), pos + length)
+
+    def bounds(self, name):
+        """Bounding box (x0, y0, x1, y1) of a curve's control points,
+        without decoding it."""
+        if name in self.entries:
+            return self.entries[name][4]
+        points = self.decoded[name].points
+        if len(points) == 0:
+            return (0.0, 0.0, 0.0, 0.0)
+        return tuple(points.min(axis=0)) + tuple(points.max(axis=0))
+
+    def ctype(self, name):
+        """Type of a curve, without decoding it."""
+        if name in self.entries:
+            return self.entries[name][3]
+        return self.decoded[name].ctype
+
+    def is_decoded(self, name):
+        return name in self.decoded
+
+    def __getitem__(self, name):
+        if name not in self.decoded:
+            if name not in self.entries:
+                raise KeyError(name)
+            self.decoded[name] = self._decode(name, *self.entries.pop(name))
+            if not self.entries:
+                self.close()
+        return self.decoded[name]
+
+    def _decode(self, name, offset, points_no, flags, ctype, bounds):
+        points = np.frombuffer(self.map, dtype='<f8', count=2 * points_no,
+                               offset=offset).reshape(points_no, 2)
+        if flags & FLAG_WEIGHTS:
+            weights = np.frombuffer(self.map, dtype='<f8', count=points_no,
+                                    offset=offset + points.nbytes)
+        else:
+            weights = np.ones(points_no)
+        curve = Curve.from_arrays(ctype, points, weights, name)
+        curve.is_hull = bool(flags & FLAG_HULL)
+        curve.is_guide = bool(flags & FLAG_GUIDE)
+        curve.continuity = ('c1' if flags & FLAG_C1 else
+                            'g1' if flags & FLAG_G1 else 'none')
+        return curve
+
+    def __setitem__(self, name, curve):
+        self.entries.pop(name, None)
+        self.decoded[name] = curve
+        self.order[name] = None
+
+    def __delitem__(self, name):
+        if name not in self.order:
+            raise KeyError(name)
+        self.entries.pop(name, None)
+        self.decoded.pop(name, None)
+        del self.order[name]
+        if not self.entries:
+            self.close()
+
+    def __iter__(self):
+        return iter(list(self.order))
+
+    def __len__(self):
+        return len(self.order)
+
+    def close(self):
+        if self.map is not None:
+            # Any curve still undecoded is read now, while the map is open.
+            for name in list(self.entries):
+                self.decoded[name] = self._decode(name,
+                                                  *self.entries.pop(name))
+            self.map.close()
+            self.map = None
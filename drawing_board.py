@@ -1,153 +1,534 @@
 # -*- coding: utf-8 -*-
 
-from PyQt5.QtCore import QObject
-from PyQt5.QtWidgets import QFrame
-from PyQt5.QtGui import (QColor, QPainter, QPen, QBrush)
+import math
+import time
+
+from PyQt5.QtCore import (Qt, QObject, QPointF, QRect, QRectF, QSize,
+                          QTimer)
+from PyQt5.QtWidgets import (QFrame, QRubberBand)
+from PyQt5.QtGui import (QPainter, QPixmap, QColor)
+import numpy as np
 
 from utils import L2Dist
-from curve import Curve
+from curve import (Curve, HULL_BOUNDED)
+from document import LazyCurves
+from spatial_index import SegmentGrid
+from evaluation import PlotEvaluator
+from history import History
+from journal import apply_op
+from rendering import (viewTransform, drawInactive, drawActive)
+from metrics import (log, metrics)
 
 
 class DrawingBoard(QFrame, QObject):
+    targetFps = 60
+    hudRect = QRect(5, 5, 280, 96)
+    minZoom = 1 / 16
+    maxZoom = 4096
+
     def __init__(self, parent):
         super().__init__(parent)
         self.setMouseTracking(True)
         self.curves = {}
         self.activeCurve = None
         self.pointDragged = None
+        # The button whose press opened a history group; other buttons
+        # are ignored until it is released, which closes the group.
+        self.dragButton = None
         self.pointSelected = None
+        # Indices of the selected points of the active curve; edits made
+        # through the transform methods apply to all of them.
+        self.selection = set()
         self.selectedX = None
         self.selectedY = None
+        self.dragAt = None
+        self.bandStart = None
+        # Whether the current press toggled a point with Shift; its
+        # release then leaves the selection alone.
+        self.toggling = False
+        self.band = QRubberBand(QRubberBand.Rectangle, self)
         self.c = None
+        self.segmentGrid = SegmentGrid()
+        self.backdrop = None
+        self.activeRect = None
+        self.pendingMoves = {}
+        self.pendingShift = None
+        self.frameTimer = QTimer(self)
+        self.frameTimer.setSingleShot(True)
+        self.frameTimer.timeout.connect(self.flushEdits)
+        self.evaluator = PlotEvaluator(self)
+        self.evaluator.plotReady.connect(self.plotReady)
+        self.journal = None
+        self.history = History()
+        self.hud = False
+        self.frameTime = 0.0
+        self.zoom = 1.0
+        self.origin = (0.0, 0.0)
+        self.panStart = None
+        self.visibleCount = 0
 
-    def loadCurves(self, curves):
-        self.curves = curves
-        print(self.curves.keys())
+    def record(self, *op, undo=None, redo=None, key=None):
+        """Journals an edit and, given the operations undoing it, adds it
+        to the history; redo replaces the edit itself there."""
+        if self.journal is not None:
+            self.journal.record(*op)
+        if undo is not None:
+            self.history.push(redo or [list(op)], undo, key)
+
+    def placeOp(self, curve, span):
+        span = list(span)
+        return ['place', self.activeCurve, span, curve.points[span].copy()]
+
+    def setTargetFps(self, fps):
+        self.targetFps = fps
+
+    def scheduleMove(self, i, x=None, y=None):
+        """Queues a point move to be applied with the next frame.
+
+        Moves arriving within one frame are merged, so the curve is
+        re-tessellated and the selection signalled once per frame.
+        """
+        (oldX, oldY) = self.pendingPoint(i)
+        self.pendingMoves[i] = (x if x is not None else oldX,
+                                y if y is not None else oldY)
+        if not self.frameTimer.isActive():
+            self.frameTimer.start(int(1000 / self.targetFps))
+
+    def scheduleShift(self, dx, dy):
+        """Queues a move of the whole selection, like scheduleMove."""
+        (x, y) = self.pendingShift or (0.0, 0.0)
+        self.pendingShift = (x + dx, y + dy)
+        if not self.frameTimer.isActive():
+            self.frameTimer.start(int(1000 / self.targetFps))
+
+    def pendingPoint(self, i):
+        if i in self.pendingMoves:
+            return self.pendingMoves[i]
+        return self.curves[self.activeCurve].points[i]
+
+    def flushEdits(self):
+        self.frameTimer.stop()
+        if self.pendingShift is not None:
+            (dx, dy) = self.pendingShift
+            self.pendingShift = None
+            # A drag of the selection is one entry in the history.
+            self.applyTransform([[1.0, 0.0, dx], [0.0, 1.0, dy]],
+                                key=('transform', self.activeCurve))
+        if not self.pendingMoves:
+            return
+        curve = self.curves[self.activeCurve]
+        moved = set()
+        self.history.begin_group()
+        for (i, (x, y)) in self.pendingMoves.items():
+            span = curve.linked_span(i)
+            undo = [self.placeOp(curve, span)]
+            curve.move_point_to(i, x, y)
+            self.record('move', self.activeCurve, i, x, y, undo=undo,
+                        key=('move', self.activeCurve, i))
+            moved.update(span)
+        self.history.end_group()
+        self.pendingMoves = {}
+        self.emitSignals(moved, ('points',))
+        self.updateActive()
+
+    def loadCurves(self, curves, active=None):
+        self.pendingMoves = {}
+        self.pendingShift = None
+        # The function bar lists the old curves until told otherwise.
+        for cname in self.curves:
+            self.c.curveRemoved.emit(cname)
+        self.evaluator.forget()
         self.curves = curves
-        self.activeCurve = list(self.curves.keys())[0]
-        self.c.selectedCurveName.emit(self.activeCurve)
+        log.debug('loading %d curves, active %r', len(curves), active)
+        self.segmentGrid = SegmentGrid()
+        # Drops the group of a drag in progress along with the rest.
+        self.dragButton = None
+        self.history.clear()
+        if active is None and len(self.curves) > 0:
+            active = next(iter(self.curves))
+        self.activeCurve = active
+        for cname in self.curves:
+            self.c.addCurve.emit(cname)
         self.pointDragged = None
         self.pointSelected = None
+        self.selection = set()
         self.selectedX = None
         self.selectedY = None
-        self.update()
+        if self.activeCurve is not None:
+            self.c.selectedCurveName.emit(self.activeCurve)
+        self.emitSignals(fields=('curves',))
+        self.invalidateBackdrop()
 
     def connectEvents(self, c):
         self.c = c
 
+    def toModel(self, ex, ey):
+        point = self.viewTransform().inverted()[0].map(QPointF(ex, ey))
+        return (point.x(), point.y())
+
+    def pixelScale(self):
+        """Pixels per model unit along x and y at the current zoom."""
+        return (self.width() * self.zoom, self.height() * self.zoom)
+
+    def plotScale(self):
+        """The scale plots are sampled for: the pixel scale rounded up to
+        a power of two, so resizing the board and small zoom steps reuse
+        the plots without sampling them coarser than the screen."""
+        return tuple(2.0 ** math.ceil(math.log2(max(scale, 1.0)))
+                     for scale in self.pixelScale())
+
+    def pointAt(self, ex, ey, radius=8):
+        (x, y) = self.toModel(ex, ey)
+        return self.curves[self.activeCurve].point_at(
+            x, y, *self.pixelScale(), radius)
+
+    def curveAt(self, ex, ey, radius=5):
+        hit = self.curveHit(ex, ey, radius)
+        return None if hit is None else hit[0]
+
+    def curveHit(self, ex, ey, radius=5):
+        """The curve passing closest to (ex, ey) within radius pixels, as
+        (name, projection) with the projection from Curve.project."""
+        (x, y) = self.toModel(ex, ey)
+        (scx, scy) = self.pixelScale()
+        best = None
+        for (curve, segments) in self.segmentGrid.candidates(
+                x, y, scx, scy, radius).items():
+            hit = curve.project(x, y, scx, scy, segments)
+            if hit is not None and hit[2] <= radius and (
+                    best is None or hit[2] < best[1][2]):
+                best = (curve, hit)
+        if best is None:
+            return None
+        for (cname, candidate) in self.loadedCurves():
+            if candidate is best[0]:
+                return (cname, best[1])
+        return None
+
+    def loadedCurves(self):
+        """(name, curve) pairs of the curves decoded so far."""
+        if isinstance(self.curves, LazyCurves):
+            return ((cname, self.curves[cname]) for cname in self.curves
+                    if self.curves.is_decoded(cname))
+        return self.curves.items()
+
+    def curveBounds(self, cname):
+        # Undecoded Bézier curves are culled by the control point bounds
+        # stored in the document, without decoding them.
+        curves = self.curves
+        if (isinstance(curves, LazyCurves) and
+                not curves.is_decoded(cname) and
+                curves.ctype(cname) in HULL_BOUNDED):
+            return curves.bounds(cname)
+        return curves[cname].bounds()
+
+    def visibleBounds(self, margin=2):
+        """Model rectangle on screen, grown by margin pixels."""
+        rect = QRectF(self.rect()).adjusted(-margin, -margin, margin, margin)
+        view = self.viewTransform().inverted()[0].mapRect(rect)
+        return (view.left(), view.top(), view.right(), view.bottom())
+
+    def isVisible(self, cname, view):
+        (x0, y0, x1, y1) = self.curveBounds(cname)
+        return x1 >= view[0] and x0 <= view[2] and y1 >= view[1] and \
+            y0 <= view[3]
+
+    def zoomAt(self, ex, ey, factor):
+        """Zooms by factor keeping the model point under (ex, ey) still."""
+        (x, y) = self.toModel(ex, ey)
+        self.zoom = min(max(self.zoom * factor, self.minZoom), self.maxZoom)
+        (scx, scy) = self.pixelScale()
+        self.origin = (x - (ex - 5) / scx, y - (ey - 5) / scy)
+        self.invalidateBackdrop()
+
+    def panBy(self, dx, dy):
+        (scx, scy) = self.pixelScale()
+        self.origin = (self.origin[0] - dx / scx, self.origin[1] - dy / scy)
+        self.invalidateBackdrop()
+
+    def resetView(self):
+        self.zoom = 1.0
+        self.origin = (0.0, 0.0)
+        self.invalidateBackdrop()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.zoomAt(event.x(), event.y(), 1.25 ** steps)
+
     def mousePressEvent(self, event):
+        self.flushEdits()
+        if self.dragButton is not None:
+            return
+        if event.button() == Qt.MiddleButton:
+            self.panStart = (event.x(), event.y())
+            return
+        if event.modifiers() & Qt.ControlModifier:
+            cname = self.curveAt(event.x(), event.y())
+            if cname is not None:
+                self.selectCurve(cname)
+                self.c.selectedCurveName.emit(cname)
+            return
         if self.activeCurve is not None:
-            ex = event.x()
-            ey = event.y()
-            for (i, (x, y)) in enumerate(self.curves[self.activeCurve].points):
-                if L2Dist(x * self.width() + 5, y * self.height() + 5,
-                          ex, ey) < 8:
-                    self.pointDragged = i
-                    self.selectedX = ex
-                    self.selectedY = ey
+            (x, y) = self.toModel(event.x(), event.y())
+            i = self.pointAt(event.x(), event.y())
+            if event.modifiers() & Qt.ShiftModifier:
+                if i is None:
+                    self.bandStart = event.pos()
+                    self.band.setGeometry(QRect(self.bandStart, QSize()))
+                    self.band.show()
+                else:
+                    self.selection ^= {i}
+                    self.pointSelected = i if i in self.selection else None
+                    self.toggling = True
+                self.emitSignals()
+                self.updateActive()
+                return
+            if i is not None:
+                if i not in self.selection:
+                    self.selection = {i}
+                self.pointDragged = i
+                self.selectedX = x
+                self.selectedY = y
+                self.dragAt = (x, y)
+                # The whole drag is undone at once.
+                self.dragButton = event.button()
+                self.history.begin_group()
             if self.pointDragged is None:
-                screenX = event.x() / self.width()
-                screenY = event.y() / self.height()
-                self.curves[self.activeCurve].add_point(screenX, screenY)
-                self.selectedX = screenX
-                self.selectedY = screenY
+                curve = self.curves[self.activeCurve]
+                i = curve.points_no
+                undo = [['remove_point', self.activeCurve, i],
+                        self.placeOp(curve, curve.linked_span(i))]
+                curve.add_point(x, y)
+                self.record('add_point', self.activeCurve, x, y, undo=undo)
+                self.emitSignals(curve.linked_span(i), ('points',))
+                self.selectedX = x
+                self.selectedY = y
                 self.pointSelected = self.curves[self.activeCurve].points_no - 1
+                self.selection = {self.pointSelected}
         self.emitSignals()
-        self.update()
+        self.updateActive()
 
     def mouseMoveEvent(self, event):
-        x = event.x() / self.width()
-        y = event.y() / self.height()
+        if self.panStart is not None:
+            self.panBy(event.x() - self.panStart[0],
+                       event.y() - self.panStart[1])
+            self.panStart = (event.x(), event.y())
+            return
+        if self.bandStart is not None:
+            self.band.setGeometry(
+                QRect(self.bandStart, event.pos()).normalized())
+            return
+        (x, y) = self.toModel(event.x(), event.y())
         text = "x: {0},  y: {1}".format(x, y)
+        hit = None if self.pointDragged is not None else self.curveHit(
+            event.x(), event.y(), radius=8)
+        if hit is not None:
+            (cname, (t, _, _, along)) = hit
+            text += "  |  {0}: t = {1:.4f}, {2:.4f} of {3:.4f} along".format(
+                cname, t, along, self.curves[cname].length())
         self.c.updateStatusBar.emit(text)
         if self.pointDragged is not None:
             distance = L2Dist(self.selectedX, self.selectedY, x, y)
-            if distance > 5 / self.height():
+            if distance > 5 / self.pixelScale()[1]:
                 self.pointSelected = None
-                i = self.pointDragged
-                sw5 = 5 / self.width()
-                sh5 = 5 / self.height()
-                self.curves[self.activeCurve].move_point_to(i,
-                                                            x - sw5,
-                                                            y - sh5)
-                self.emitSignals()
-                self.update()
+                if len(self.selection) > 1:
+                    self.scheduleShift(x - self.dragAt[0], y - self.dragAt[1])
+                    self.dragAt = (x, y)
+                else:
+                    self.scheduleMove(self.pointDragged, x, y)
 
     def mouseReleaseEvent(self, event):
+        self.flushEdits()
+        if self.dragButton is not None:
+            if event.button() != self.dragButton:
+                return
+            self.dragButton = None
+            self.history.end_group()
+        if self.panStart is not None:
+            self.panStart = None
+            return
+        if self.bandStart is not None:
+            self.selectInBand(QRect(self.bandStart, event.pos()).normalized())
+            return
+        if self.toggling:
+            self.toggling = False
+            return
+        (x, y) = self.toModel(event.x(), event.y())
         if self.pointSelected:
-            distance = L2Dist(self.selectedX, self.selectedY,
-                              event.x() / self.width(),
-                              event.y() / self.height())
+            distance = L2Dist(self.selectedX, self.selectedY, x, y)
             if distance < 5:
                 self.pointDragged = None
         if self.pointDragged is not None:
             self.pointSelected = self.pointDragged
         self.pointDragged = None
         if self.activeCurve is not None:
-            for (i, (x, y)) in enumerate(self.curves[self.activeCurve].points):
-                if L2Dist(x * self.width() + 5, y * self.height() + 5,
-                          event.x(), event.y()) < 8:
-                    print('SEL')
-                    self.pointSelected = i
-                    self.selectedX = event.x() / self.width()
-                    self.selectedY = event.y() / self.height()
+            i = self.pointAt(event.x(), event.y())
+            if i is not None:
+                self.pointSelected = i
+                self.selectedX = x
+                self.selectedY = y
+        if len(self.selection) <= 1:
+            self.selection = ({self.pointSelected}
+                              if self.pointSelected is not None else set())
         self.emitSignals()
-        self.update()
+        self.updateActive()
+
+    def selectInBand(self, rect):
+        """Adds the points inside a widget rectangle to the selection."""
+        self.band.hide()
+        self.bandStart = None
+        if self.activeCurve is not None:
+            (x0, y0) = self.toModel(rect.left(), rect.top())
+            (x1, y1) = self.toModel(rect.right(), rect.bottom())
+            points = self.curves[self.activeCurve].points
+            inside = np.all((points >= (x0, y0)) & (points <= (x1, y1)),
+                            axis=1)
+            self.selection.update(np.flatnonzero(inside).tolist())
+        self.emitSignals()
+        self.updateActive()
+
+    def selectAll(self):
+        if self.activeCurve is not None:
+            points_no = self.curves[self.activeCurve].points_no
+            self.selection = set(range(points_no))
+            self.emitSignals()
+            self.updateActive()
+
+    def clearSelection(self):
+        self.selection = set()
+        self.pointSelected = None
+        self.emitSignals()
+        self.updateActive()
+
+    def transformSelection(self, matrix):
+        """Maps every selected point by the affine matrix
+        [[a, b, tx], [c, d, ty]] as a single edit."""
+        self.flushEdits()
+        self.applyTransform(matrix)
+
+    def applyTransform(self, matrix, key=None):
+        if self.activeCurve is None or not self.selection:
+            return
+        curve = self.curves[self.activeCurve]
+        indices = sorted(self.selection)
+        span = curve.transform_span(indices)
+        undo = [self.placeOp(curve, span)]
+        curve.transform_points(indices, matrix)
+        # Merged edits redo to where the points end up.
+        redo = None if key is None else [self.placeOp(curve, span)]
+        self.record('transform', self.activeCurve, indices,
+                    np.asarray(matrix, dtype=np.float64).tolist(),
+                    undo=undo, redo=redo, key=key)
+        self.emitSignals(span, ('points',))
+        self.updateActive()
+
+    def translateSelection(self, dx, dy):
+        self.transformSelection([[1.0, 0.0, dx], [0.0, 1.0, dy]])
+
+    def scaleSelection(self, sx, sy=None):
+        """Scales the selection about the centre of its bounding box."""
+        self.transformAboutCenter([[sx, 0.0], [0.0, sx if sy is None else sy]])
+
+    def rotateSelection(self, degrees):
+        """Rotates the selection as seen on screen, about the centre of
+        its bounding box."""
+        # In model units the axes are scaled differently; rotate pixels.
+        (scx, scy) = self.pixelScale()
+        (cos, sin) = (math.cos(math.radians(degrees)),
+                      math.sin(math.radians(degrees)))
+        self.transformAboutCenter([[cos, -sin * scy / scx],
+                                   [sin * scx / scy, cos]])
+
+    def transformAboutCenter(self, linear):
+        if self.activeCurve is None or not self.selection:
+            return
+        self.flushEdits()
+        points = self.curves[self.activeCurve].points[sorted(self.selection)]
+        center = (points.min(axis=0) + points.max(axis=0)) / 2
+        linear = np.asarray(linear, dtype=np.float64)
+        self.applyTransform(np.column_stack((linear,
+                                             center - linear @ center)))
 
     def cyclePoint(self, order):
+        self.flushEdits()
         if self.curves[self.activeCurve].points_no > 0:
             self.pointSelected = (self.pointSelected + order)
             self.pointSelected %= self.curves[self.activeCurve].points_no
             self.emitSignals()
-            self.update()
+            self.updateActive()
 
     def gotoPoint(self, pointId):
+        self.flushEdits()
         points_no = self.curves[self.activeCurve].points_no
         if points_no > 0 and pointId < points_no:
             self.pointSelected = pointId
             self.emitSignals()
-            self.update()
+            self.updateActive()
 
     def moveXPoint(self, newCoord):
         i = self.pointSelected
-        self.curves[self.activeCurve].move_point_by(i, newCoord, 0)
-        self.emitSignals()
-        self.update()
+        self.scheduleMove(i, x=self.pendingPoint(i)[0] + newCoord)
 
     def moveXPointTo(self, newCoord):
-        i = self.pointSelected
-        self.curves[self.activeCurve].move_point_to(i, x=newCoord)
-        self.emitSignals()
-        self.update()
+        self.scheduleMove(self.pointSelected, x=newCoord)
 
     def moveYPoint(self, newCoord):
         i = self.pointSelected
-        self.curves[self.activeCurve].move_point_by(i, 0, newCoord)
-        self.emitSignals()
-        self.update()
+        self.scheduleMove(i, y=self.pendingPoint(i)[1] + newCoord)
 
     def moveYPointTo(self, newCoord):
-        i = self.pointSelected
-        self.curves[self.activeCurve].move_point_to(i, y=newCoord)
-        self.emitSignals()
-        self.update()
+        self.scheduleMove(self.pointSelected, y=newCoord)
 
     def toggleHull(self, is_hull):
         self.curves[self.activeCurve].toggle_hull(is_hull)
-        self.update()
+        self.record('hull', self.activeCurve, is_hull,
+                    undo=[['hull', self.activeCurve, not is_hull]])
+        self.emitSignals(fields=('hull',))
+        self.updateActive()
 
     def toggleGuide(self, is_guide):
         self.curves[self.activeCurve].toggle_guide(is_guide)
-        self.update()
+        self.record('guide', self.activeCurve, is_guide,
+                    undo=[['guide', self.activeCurve, not is_guide]])
+        self.emitSignals(fields=('guide',))
+        self.updateActive()
+
+    def toggleWeights(self, is_rational):
+        self.flushEdits()
+        if self.activeCurve is None:
+            return
+        curve = self.curves[self.activeCurve]
+        if (curve.ctype not in ('bezier', 'rbezier') or
+                (curve.ctype == 'rbezier') == is_rational):
+            return
+        curve.set_rational(is_rational)
+        self.record('rational', self.activeCurve, is_rational,
+                    undo=[['rational', self.activeCurve, not is_rational]])
+        self.emitSignals(fields=('ctype',))
+        self.updateActive()
+
+    def changeWeight(self, weight):
+        self.flushEdits()
+        if self.activeCurve is None or self.pointSelected is None:
+            return
+        curve = self.curves[self.activeCurve]
+        i = self.pointSelected
+        undo = [['weight', self.activeCurve, i, float(curve.weights[i])]]
+        curve.set_weight(i, weight)
+        self.record('weight', self.activeCurve, i, weight, undo=undo)
+        self.emitSignals((i,), ('weights',))
+        self.updateActive()
 
     def addCurve(self, ctype, cname=''):
         if cname == '':
             cname = "Curve {}".format(len(self.curves) + 1)
         self.curves[cname] = Curve(ctype=ctype)
+        self.record('add_curve', cname, ctype, undo=[['remove', cname]])
+        self.emitSignals(fields=('curves',), cname=cname)
         self.c.addCurve.emit(cname)
         self.selectCurve(cname)
         self.c.selectedCurveName.emit(cname)
-        self.update()
 
     def addBCurve(self):
         self.addCurve('bezier')
@@ -161,65 +542,300 @@ class DrawingBoard(QFrame, QObject):
     def addPSCurve(self):
         self.addCurve('pspline')
 
+    def addBSCurve(self):
+        self.addCurve('bzspline')
+
+    def importCurves(self, curves, name):
+        """Adds the curves as one edit, naming them after name, and
+        selects the last."""
+        self.flushEdits()
+        self.history.begin_group()
+        for (k, curve) in enumerate(curves):
+            base = name if len(curves) == 1 else '{} {}'.format(name, k + 1)
+            (cname, copy) = (base, 1)
+            while cname in self.curves:
+                copy += 1
+                cname = '{} ({})'.format(base, copy)
+            self.curves[cname] = curve
+            self.record('restore', cname, curve.__getstate__(),
+                        undo=[['remove', cname]])
+            self.emitSignals(fields=('curves',), cname=cname)
+            self.c.addCurve.emit(cname)
+        self.history.end_group()
+        self.selectCurve(cname)
+        self.c.selectedCurveName.emit(cname)
+
+    def setContinuity(self, continuity):
+        self.flushEdits()
+        if self.activeCurve is None:
+            return
+        curve = self.curves[self.activeCurve]
+        undo = [['shape', self.activeCurve, curve.shape()]]
+        curve.set_continuity(continuity)
+        self.record('continuity', self.activeCurve, continuity, undo=undo)
+        self.emitSignals(fields=('shape',))
+        self.updateActive()
+
+    def convertToSpline(self):
+        """Turns the active Bézier curve into a Bézier spline tracing it
+        to within half a pixel."""
+        self.flushEdits()
+        if (self.activeCurve is None or
+                self.curves[self.activeCurve].ctype not in ('bezier',
+                                                            'rbezier')):
+            return
+        tolerance = 0.5 / max(*self.pixelScale(), 1)
+        curve = self.curves[self.activeCurve]
+        undo = [['shape', self.activeCurve, curve.shape()]]
+        curve.convert_to_bezier_spline(tolerance)
+        self.record('convert', self.activeCurve, tolerance, undo=undo)
+        self.pointSelected = None
+        self.selection = set()
+        self.emitSignals(fields=('shape',))
+        self.updateActive()
+
     def renameCurve(self, text):
-        self.curves[text] = self.curves[self.activeCurve]
-        self.curves.pop(self.activeCurve)
+        self.flushEdits()
+        self.curves[text] = self.curves.pop(self.activeCurve)
+        self.evaluator.forget(self.curves[text])
+        self.record('rename', self.activeCurve, text,
+                    undo=[['rename', text, self.activeCurve]])
         self.activeCurve = text
+        self.emitSignals(fields=('curves',))
         self.update()
 
     def removeCurve(self, cname):
-        self.curves.pop(cname)
-        self.update()
+        self.flushEdits()
+        curve = self.curves.pop(cname)
+        self.segmentGrid.remove(curve)
+        self.evaluator.forget(curve)
+        self.record('remove', cname,
+                    undo=[['restore', cname, curve.__getstate__()]])
+        self.c.curveRemoved.emit(cname)
+        self.emitSignals(fields=('curves',), cname=cname)
+        self.invalidateBackdrop()
+
+    def undo(self):
+        self.flushEdits()
+        self.applyHistory(self.history.undo())
+
+    def redo(self):
+        self.flushEdits()
+        self.applyHistory(self.history.redo())
+
+    def applyHistory(self, ops):
+        """Replays undo or redo operations; only the curves they touch
+        are re-plotted."""
+        if not ops:
+            return
+        active = self.curves.get(self.activeCurve)
+        touched = set()
+        for op in ops:
+            (kind, name) = (op[0], op[1])
+            if kind in ('remove', 'rename'):
+                self.evaluator.forget(self.curves[name])
+            if kind == 'remove':
+                self.segmentGrid.remove(self.curves[name])
+            self.record(*op)
+            (self.curves, self.activeCurve) = apply_op(
+                self.curves, self.activeCurve, op)
+            if kind in ('add_curve', 'restore'):
+                self.c.addCurve.emit(name)
+            elif kind == 'remove':
+                self.c.curveRemoved.emit(name)
+            elif kind == 'rename':
+                self.c.curveRenamed.emit(name, op[2])
+                touched.discard(name)
+                name = op[2]
+            touched.add(name)
+            self.emitSignals(fields=('shape', 'curves'), cname=name)
+        if self.activeCurve is None and len(self.curves) > 0:
+            self.activeCurve = next(iter(self.curves))
+        self.pointDragged = None
+        switched = self.curves.get(self.activeCurve) is not active
+        if switched:
+            self.pointSelected = None
+            self.selection = set()
+            if self.activeCurve is not None:
+                self.record('select', self.activeCurve)
+                self.c.selectedCurveName.emit(self.activeCurve)
+        else:
+            self.selection = {i for i in self.selection
+                              if i < active.points_no}
+            if (self.pointSelected is not None and
+                    self.pointSelected >= active.points_no):
+                self.pointSelected = None
+        self.emitSignals()
+        if switched or not touched <= {self.activeCurve}:
+            self.invalidateBackdrop()
+        else:
+            self.updateActive()
 
     def selectCurve(self, cname):
+        self.flushEdits()
         self.activeCurve = cname
+        self.record('select', cname)
         self.pointSelected = None
-        print(cname)
+        self.selection = set()
+        log.debug('selected curve %r', cname)
+        self.emitSignals()
+        self.invalidateBackdrop()
+
+    def emitSignals(self, points=(), fields=(), cname=None):
+        """Reports a change of a curve, the active one by default, along
+        with the selection; listeners get the changes of one pass of the
+        event loop together."""
+        self.c.notify(self.curves, (self.activeCurve, self.pointSelected),
+                      self.activeCurve if cname is None else cname,
+                      points, fields)
+
+    def viewTransform(self):
+        return viewTransform(self.width(), self.height(), self.zoom,
+                             self.origin)
+
+    def invalidateBackdrop(self):
+        self.backdrop = None
+        self.activeRect = None
         self.update()
 
-    def emitSignals(self):
-        if self.pointSelected is not None:
-            i = self.pointSelected
-            point = self.curves[self.activeCurve].points[i]
-            self.c.updateSelectedPoint.emit(str(i),
-                                            str(point[0]),
-                                            str(point[1]))
+    def updateActive(self):
+        """Repaints only the part of the board the active curve covers,
+        before and after the change."""
+        oldRect = self.activeRect
+        self.activeRect = self.activeBounds()
+        if oldRect is None:
+            self.update()
+        elif self.hud:
+            # The overlay changes size with its text; repaint its rows.
+            self.update(oldRect.united(self.activeRect).united(
+                QRect(0, 0, self.width(), self.hudRect.bottom() + 1)))
+        else:
+            self.update(oldRect.united(self.activeRect))
+
+    def activeBounds(self):
+        if self.activeCurve is None:
+            return QRectF().toAlignedRect()
+        curve = self.curves[self.activeCurve]
+        self.makePlot(curve)
+        covered = np.vstack((curve.samples,
+                             np.asarray(curve.points, dtype=np.float64
+                                        ).reshape(-1, 2)))
+        if len(covered) == 0:
+            return QRectF().toAlignedRect()
+        (x0, y0) = covered.min(axis=0)
+        (x1, y1) = covered.max(axis=0)
+        bounds = self.viewTransform().mapRect(QRectF(x0, y0, x1 - x0, y1 - y0))
+        # Leave room for the point markers and their labels.
+        return bounds.toAlignedRect().adjusted(-8, -8, 64, 24)
+
+    def makePlot(self, curve):
+        """Brings a curve's plot up to date, in the background if possible.
+
+        Until a background job finishes, the last plot stays on screen.
+        """
+        (scx, scy) = self.plotScale()
+        if not curve.needs_plot(scx, scy):
+            metrics.hit('plot', True)
+        if self.evaluator is not None and curve.needs_plot(scx, scy):
+            self.evaluator.request(curve, scx, scy)
+            curve.make_overlays()
+        else:
+            curve.make_plot(scx, scy)
+        self.segmentGrid.update(curve, curve.samples, curve.plot_version)
+
+    def plotReady(self, curve):
+        if self.curves.get(self.activeCurve) is curve:
+            self.updateActive()
+        elif any(candidate is curve
+                 for (_, candidate) in self.loadedCurves()):
+            self.backdrop = None
+            self.update()
+
+    def renderBackdrop(self):
+        """Draws every inactive curve into a cached pixmap."""
+        self.backdrop = QPixmap(self.size())
+        self.backdrop.fill(Qt.transparent)
+        painter = QPainter(self.backdrop)
+        painter.setTransform(self.viewTransform())
+        view = self.visibleBounds()
+        inactive = [self.curves[curve_name] for curve_name in self.curves
+                    if self.activeCurve != curve_name and
+                    self.isVisible(curve_name, view)]
+        self.visibleCount = len(inactive)
+        for curve in inactive:
+            self.makePlot(curve)
+        drawInactive(painter, inactive)
+        metrics.count('backdrop.renders')
+        painter.end()
+
+    def resizeEvent(self, event):
+        self.backdrop = None
+        self.activeRect = None
+        super().resizeEvent(event)
 
     def paintEvent(self, event):
-        # TODO scale all X by self.width() and all Y by self.height()
+        start = time.perf_counter()
         painter = QPainter(self)
+        metrics.hit('backdrop', self.backdrop is not None)
+        if self.backdrop is None:
+            self.renderBackdrop()
+        painter.drawPixmap(event.rect(), self.backdrop, event.rect())
+
+        # Plots are cached in model space, the view transform maps them
+        # onto the widget; as plotScale is rounded to a power of two,
+        # resizing costs no curve evaluation unless the size doubles or
+        # halves.
+        if self.activeCurve is not None:
+            self.makePlot(self.curves[self.activeCurve])
+            drawActive(painter, self.curves[self.activeCurve],
+                       self.viewTransform(), self.pointSelected,
+                       marked=self.selection)
+        if self.activeRect is None:
+            self.activeRect = self.activeBounds()
+        if self.hud:
+            self.drawHud(painter)
+        painter.end()
+        self.frameTime = time.perf_counter() - start
+        metrics.count('repaints')
+        metrics.add_time('paint', self.frameTime)
+
+    def setHud(self, hud):
+        """Shows frame timing over the board; needs metrics enabled."""
+        self.hud = hud
+        if hud:
+            metrics.enabled = True
+        self.update()
 
-        print(self.curves)
-        for curve_name in self.curves:
-            self.curves[curve_name].make_plot(self.width(), self.height())
-            print("zmejkplocony")
-            if self.activeCurve != curve_name:
-                painter.setPen(QPen(QColor(120, 120, 120)))
-                painter.drawPolyline(self.curves[curve_name].plot)
+    def drawHud(self, painter):
+        def percent(rate):
+            return '-' if rate is None else '{:.0f}%'.format(100 * rate)
 
+        paint = metrics.timer_stats('paint')
+        lines = ['frame {:.2f} ms, mean {:.2f} ms'.format(
+            1000 * self.frameTime, 1000 * paint['mean'] if paint else 0.0)]
         if self.activeCurve is not None:
-            print(self.curves[self.activeCurve].points)
-            if self.curves[self.activeCurve].is_hull:
-                painter.setPen(QPen(QColor(0, 0, 255)))
-                painter.drawPolygon(self.curves[self.activeCurve].hull)
-            if self.curves[self.activeCurve].is_guide:
-                painter.setPen(QPen(QColor(255, 0, 0)))
-                painter.drawPolyline(self.curves[self.activeCurve].guide)
-            #  potem aktywna
-            painter.setPen(QPen(QColor(0, 0, 0)))
-            print(self.curves[self.activeCurve].plot)
-            painter.drawPolyline(self.curves[self.activeCurve].plot)
-
-            #  potem zaznaczone punkty
-            if self.pointSelected is not None:
-                painter.setPen(QPen(QColor(255, 0, 0)))
-                x, y = self.curves[self.activeCurve].points[self.pointSelected]
-                painter.drawRect(self.width() * x, self.height() * y, 10, 10)
-
-            #  i same punkty
-            painter.setPen(QPen(QColor(0, 0, 0)))
-            painter.setBrush(QBrush(QColor(0, 154, 0)))
-            for (i, (x, y)) in enumerate(self.curves[self.activeCurve].points):
-                painter.drawEllipse(self.width() * x, self.height() * y, 10, 10)
-                painter.drawText(self.width() * x + 10,
-                                 self.height() * y + 20, str(i))
+            lines.append('{}: {:.2f} ms'.format(
+                self.activeCurve,
+                1000 * self.curves[self.activeCurve].plot_time))
+        loaded = list(self.loadedCurves())
+        if loaded:
+            (slowest, curve) = max(loaded, key=lambda item: item[1].plot_time)
+            lines.append('slowest {}: {:.2f} ms'.format(
+                slowest, 1000 * curve.plot_time))
+        lines.append('zoom {:.3g}, {} of {} other curves drawn'.format(
+            self.zoom, self.visibleCount, max(len(self.curves) - 1, 0)))
+        lines.append('plot cache {}, backdrop cache {}'.format(
+            percent(metrics.hit_rate('plot')),
+            percent(metrics.hit_rate('backdrop'))))
+        lines.append('tessellations {}, hull rebuilds {}'.format(
+            metrics.counters.get('tessellations', 0),
+            metrics.counters.get('hull.rebuilds', 0)))
+        painter.resetTransform()
+        font = painter.fontMetrics()
+        self.hudRect = QRect(5, 5, 12 + max(font.width(line)
+                                            for line in lines),
+                             8 + font.lineSpacing() * len(lines))
+        painter.fillRect(self.hudRect, QColor(255, 255, 255, 210))
+        painter.setPen(QColor(0, 0, 0))
+        painter.drawText(self.hudRect.adjusted(6, 4, -6, -4),
+                         Qt.AlignLeft | Qt.AlignTop, '\n'.join(lines))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import (Qt, QObject, pyqtSignal)
+
+from metrics import log
+
+
+class PlotEvaluator(QObject):
+    """Tessellates curves on a pool of worker threads.
+
+    Each job works on a snapshot taken by Curve.prepare_plot and is
+    tagged with the curve's edit version. A result is installed only if
+    the curve has not been edited since; otherwise it is dropped and
+    plotReady still fires so the caller can ask again. Failed jobs are
+    reported and not retried until the curve is edited or plotted at
+    another scale. At most one job per curve is in flight, which merges
+    bursts of edits. A curve that is removed or renamed is forgotten:
+    its failure and the job it has in flight no longer count. The NumPy
+    kernels release the GIL, so different curves evaluate in parallel.
+    """
+
+    plotReady = pyqtSignal(object)
+    finished = pyqtSignal(object, object, object)
+
+    def __init__(self, parent=None, workers=None):
+        super().__init__(parent)
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.running = {}
+        # The version and scale each curve's last job failed for.
+        self.failed = {}
+        # Queued even when a job is done before its callback is added and
+        # deliver runs in this thread: accepting the plot may repaint, so
+        # it must not happen in the middle of a paint.
+        self.finished.connect(self.accept, Qt.QueuedConnection)
+
+    def request(self, curve, scx, scy):
+        if curve in self.running or \
+                self.failed.get(curve) == (curve.version, scx, scy):
+            return
+        version = curve.version
+        self.running[curve] = version
+        future = self.pool.submit(curve.prepare_plot(scx, scy))
+        future.add_done_callback(
+            lambda future: self.deliver(curve, (version, scx, scy), future))
+
+    def deliver(self, curve, job, future):
+        # Runs in the worker thread; the signal hands the result over to
+        # the thread the evaluator lives in.
+        try:
+            plot = future.result()
+        except Exception:
+            log.exception('plot evaluation failed')
+            plot = None
+        try:
+            self.finished.emit(curve, job, plot)
+        except RuntimeError:
+            # The evaluator was deleted while the job was running.
+            pass
+
+    def forget(self, curve=None):
+        """Drops what is known of curve, or of every curve."""
+        if curve is None:
+            self.running.clear()
+            self.failed.clear()
+        else:
+            self.running.pop(curve, None)
+            self.failed.pop(curve, None)
+
+    def accept(self, curve, job, plot):
+        if self.running.get(curve) != job[0]:
+            # The curve was forgotten while the job was running.
+            return
+        del self.running[curve]
+        if plot is None:
+            self.failed[curve] = job
+            return
+        self.failed.pop(curve, None)
+        if job[0] == curve.version:
+            curve.set_plot(plot)
+        self.plotReady.emit(curve)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
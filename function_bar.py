@@ -15,10 +15,32 @@ class FunctionBar(QFrame):
         super().__init__(parent)
         self.initUI()
         self.c = None
+        self.shownSelection = (None, None)
 
     def connectEvents(self, c):
         self.c = c
 
+    def modelChanged(self, changes):
+        """Refreshes the point and weight fields if the changes reach
+        them."""
+        (cname, i) = changes.selection
+        reselected = changes.selection != self.shownSelection
+        self.shownSelection = changes.selection
+        if cname is None or cname not in changes.curves:
+            return
+        curve = changes.curves[cname]
+        if i is not None and i >= curve.points_no:
+            i = None
+        reshaped = changes.touches(cname, 'shape', 'curves')
+        if i is not None and (reselected or reshaped or
+                              changes.point_changed(cname, i)):
+            point = curve.points[i]
+            self.updateSelectedPoint(str(i), str(point[0]), str(point[1]))
+        if reselected or reshaped or changes.touches(cname, 'ctype',
+                                                     'weights'):
+            self.updateWeights(curve.ctype,
+                               '' if i is None else str(curve.weights[i]))
+
     def updateSelectedPoint(self, id, x, y):
         self.pointIdField.setText(id)
         self.xFrame.textField.setText(x)
@@ -76,6 +98,12 @@ class FunctionBar(QFrame):
         weightLayout = QVBoxLayout()
         self.weightCheck = QCheckBox("Weights?")
         self.weightField = QLineEdit("1.0")
+        self.weightField.setStyleSheet("QWidget { background-color: %s }" %
+                                       QColor(255, 255, 255).name())
+        self.weightCheck.stateChanged.connect(self.toggleWeights)
+        self.weightField.textEdited.connect(self.changeWeight)
+        self.weightCheck.setEnabled(False)
+        self.weightField.setEnabled(False)
         weightLayout.addWidget(self.weightCheck)
         weightLayout.addWidget(self.weightField)
         weightFrame = QFrame()
@@ -172,6 +200,27 @@ class FunctionBar(QFrame):
         self.c.toggleGuide.emit(is_guide)
         self.update()
 
+    def toggleWeights(self, state):
+        is_rational = True if state == Qt.Checked else False
+        self.c.toggleWeights.emit(is_rational)
+        self.update()
+
+    def changeWeight(self, text):
+        try:
+            weight = float(text)
+        except ValueError:
+            return
+        if weight > 0:
+            self.c.changeWeight.emit(weight)
+        self.update()
+
+    def updateWeights(self, ctype, weight):
+        self.weightCheck.setEnabled(ctype in ('bezier', 'rbezier'))
+        self.weightCheck.setChecked(ctype == 'rbezier')
+        self.weightField.setEnabled(ctype == 'rbezier' and weight != '')
+        self.weightField.setText(weight)
+        self.update()
+
     def selectCurve(self, cname):
         self.c.selectCurve.emit(cname)
         self.update()
@@ -184,6 +233,14 @@ class FunctionBar(QFrame):
         self.cbox.removeItem(cname)
         self.update()
 
+    def curveRemoved(self, cname):
+        self.cbox.removeItem(self.cbox.findText(cname))
+        self.update()
+
+    def curveRenamed(self, old, new):
+        self.cbox.setItemText(self.cbox.findText(old), new)
+        self.update()
+
     def selectedCurveName(self, cname):
         self.cbox.setCurrentText(cname)
         self.update()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Undo and redo.
+
+Every edit is recorded as two lists of journal operations (see
+journal.py): those that redo it and those that undo it. They hold only
+what the edit changed, e.g. a point index and its old position, so
+undoing costs no more than the edit did. Edits made between begin_group
+and end_group, such as all the moves of one drag, form a single entry;
+edits within it pushed under the same key, e.g. moves of one point, are
+merged. Once the recorded operations take more than limit bytes, the
+oldest entries are dropped.
+"""
+
+import sys
+from collections import deque
+
+import numpy as np
+
+
+class History:
+    def __init__(self, limit=16 << 20):
+        self.limit = limit
+        # Entries are lists of (key, redo, undo) triples, oldest first.
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+        self.group = None
+        self.depth = 0
+
+    def push(self, redo, undo, key=None):
+        """Records an edit: the operations redoing it and, in the order
+        to apply them, those undoing it.
+
+        Within a group, an edit with the key of an earlier one replaces
+        its redo operations and keeps its undo ones, so edits pushed
+        under a key must redo to absolute positions.
+        """
+        self.drop_redo()
+        if self.group is not None:
+            if key is not None:
+                for (k, (old_key, old_redo, old_undo)) in enumerate(
+                        self.group):
+                    if old_key == key:
+                        self.size += op_size(redo) - op_size(old_redo)
+                        self.group[k] = (key, redo, old_undo)
+                        self.evict()
+                        return
+            self.group.append((key, redo, undo))
+        else:
+            self.undo_stack.append([(key, redo, undo)])
+        self.size += op_size(redo) + op_size(undo)
+        self.evict()
+
+    def begin_group(self):
+        """Starts an entry the following edits go into; groups nest."""
+        if self.group is None:
+            self.group = []
+            self.undo_stack.append(self.group)
+        self.depth += 1
+
+    def end_group(self):
+        self.depth = max(self.depth - 1, 0)
+        if self.depth == 0:
+            self.close_group()
+
+    def close_group(self):
+        if self.group is not None and not self.group:
+            self.undo_stack.pop()
+        self.group = None
+        self.depth = 0
+
+    def undo(self):
+        """Operations undoing the latest entry, in the order to apply
+        them, or None if there is nothing to undo."""
+        self.close_group()
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return [op for (_, _, undo) in reversed(entry) for op in undo]
+
+    def redo(self):
+        self.close_group()
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return [op for (_, redo, _) in entry for op in redo]
+
+    def can_undo(self):
+        return bool(self.undo_stack and self.undo_stack[-1])
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self.size = 0
+        self.group = None
+        self.depth = 0
+
+    def drop_redo(self):
+        for entry in self.redo_stack:
+            self.size -= entry_size(entry)
+        self.redo_stack = []
+
+    def evict(self):
+        # The entry being grouped is never dropped, however large.
+        while self.size > self.limit and len(self.undo_stack) > 1:
+            self.size -= entry_size(self.undo_stack.popleft())
+
+
+def entry_size(entry):
+    return sum(op_size(redo) + op_size(undo) for (_, redo, undo) in entry)
+
+
+def op_size(value):
+    """Rough number of bytes an operation keeps alive."""
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.flags.owndata
+                                       else value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(op_size(v)
+                                          for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(op_size(v) for v in value)
+    return sys.getsizeof(value)
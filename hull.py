@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from utils import convex_hull
+from metrics import metrics
+
+
+def cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+class DynamicHull:
+    """Convex hull of a curve's control points, kept up to date on edits.
+
+    Stores the indices of the hull vertices in counter-clockwise order.
+    Adding a point or moving a non-vertex costs O(h) for h hull vertices.
+    Moving a vertex is also O(h) unless it moves inward far enough to
+    expose other points; only then is the hull rebuilt from scratch.
+    """
+
+    def __init__(self, points):
+        self.rebuilds = 0
+        self.rebuild(points)
+
+    def rebuild(self, points):
+        conv = convex_hull((x, y, i) for (i, (x, y)) in enumerate(points))
+        self.vertices = [i for (_, _, i) in conv]
+        self.members = set(self.vertices)
+        self.rebuilds += 1
+        metrics.count('hull.rebuilds')
+
+    def add(self, points, i):
+        if len(self.vertices) < 3:
+            self.rebuild(points)
+        else:
+            self._insert(points, i)
+
+    def move(self, points, i, old):
+        if len(self.vertices) < 4:
+            self.rebuild(points)
+        elif i in self.members:
+            # Without the moved vertex the polygon is still convex; the
+            # new hull is valid only if it still covers the old position,
+            # otherwise interior points may have become vertices.
+            self.vertices.remove(i)
+            self.members.discard(i)
+            self._insert(points, i)
+            if not self._contains(points, old):
+                self.rebuild(points)
+        else:
+            self._insert(points, i)
+
+    def _contains(self, points, q):
+        h = self.vertices
+        return all(cross(points[h[k - 1]], points[h[k]], q) >= 0
+                   for k in range(len(h)))
+
+    def _insert(self, points, i):
+        q = points[i]
+        h = self.vertices
+        n = len(h)
+        for k in range(n):
+            if cross(points[h[k]], points[h[(k + 1) % n]], q) < 0:
+                break
+        else:
+            return
+        pos = k + 1
+        h.insert(pos, i)
+        self.members.add(i)
+        # Drop the neighbours that are no longer convex corners, walking
+        # forward and then backward from the new vertex.
+        while len(h) > 3:
+            nxt = (pos + 1) % len(h)
+            if cross(q, points[h[nxt]], points[h[(pos + 2) % len(h)]]) > 0:
+                break
+            self.members.discard(h.pop(nxt))
+            if nxt < pos:
+                pos -= 1
+        while len(h) > 3:
+            prv = (pos - 1) % len(h)
+            if cross(points[h[(pos - 2) % len(h)]], points[h[prv]], q) > 0:
+                break
+            self.members.discard(h.pop(prv))
+            if prv < pos:
+                pos -= 1
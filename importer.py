@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""Point cloud import.
+
+Turns the rows of CSV files and the paths of SVG files into Bézier
+splines. Files are read in chunks that are thinned as they arrive, so
+only the thinned points are ever held. Once a file is read, its points
+are scaled into a rectangle of the board, split at their corners and
+fitted by cubics.
+"""
+
+import os
+import re
+from itertools import islice
+from xml.etree import ElementTree
+
+import numpy as np
+
+from bezier_spline import fit_cubics
+from curve import Curve
+from tessellation import simplify
+from utils import bernstein_matrix
+
+CHUNK_SIZE = 1 << 16
+# Turns sharper than this many radians are kept as corners.
+CORNER_ANGLE = np.radians(60)
+# Curved segments of SVG paths are flattened into this many lines.
+FLATTEN_STEPS = 16
+_FLATTEN_BASIS = bernstein_matrix(
+    3, np.linspace(0.0, 1.0, FLATTEN_STEPS + 1)[1:])
+
+_COMMAND = re.compile(r'([MmLlHhVvCcSsQqTtAaZz])([^MmLlHhVvCcSsQqTtAaZz]*)')
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_ARITY = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2,
+          'A': 7}
+
+
+class PointCloudError(Exception):
+    pass
+
+
+def import_curves(path, rect, tolerance, chunk_size=CHUNK_SIZE):
+    """Reads a CSV or SVG file into Bézier splines.
+
+    Input: the file, the model rectangle (x0, y0, x1, y1) to fit its
+           points into and the distance the curves may stray from them.
+    Output: a list of curves, one per stroke.
+    """
+    box = np.array(rect[2:], dtype=np.float64) - rect[:2]
+    cells = CellFilter(tolerance / box.max())
+    if os.path.splitext(path)[1].lower() == '.svg':
+        chunks = svg_chunks(path)
+    else:
+        chunks = csv_chunks(path, chunk_size)
+    try:
+        for (stroke, chunk) in chunks:
+            cells.feed(stroke, chunk)
+    except (ValueError, ElementTree.ParseError) as e:
+        raise PointCloudError('Could not read {}: {}'.format(path, e))
+    strokes = [stroke for stroke in cells.strokes() if len(stroke) > 1]
+    if not strokes:
+        raise PointCloudError('{} holds no strokes'.format(path))
+    return fit_curves(strokes, rect, tolerance)
+
+
+def fit_curves(strokes, rect, tolerance, corner=CORNER_ANGLE):
+    """Fits a Bézier spline to every stroke after scaling them all alike
+    to the largest size that fits rect, centred in it."""
+    low = np.min([stroke.min(axis=0) for stroke in strokes], axis=0)
+    high = np.max([stroke.max(axis=0) for stroke in strokes], axis=0)
+    box = np.array(rect[2:], dtype=np.float64) - rect[:2]
+    extent = high - low
+    scale = (box[extent > 0] / extent[extent > 0]).min() \
+        if np.any(extent > 0) else 1.0
+    offset = (np.array(rect[:2]) + box / 2) - scale * (low + high) / 2
+    curves = []
+    for stroke in strokes:
+        pts = stroke * scale + offset
+        # Turns are judged over the distance fit_cubics takes tangents
+        # over, so that noise in the points is not taken for corners.
+        corners = find_corners(pts, 4 * tolerance, corner)
+        points = fit_cubics(pts, tolerance, corners)
+        curve = Curve.from_arrays('bzspline', points, np.ones(len(points)))
+        curve.continuity = 'none' if len(corners) else 'g1'
+        curves.append(curve)
+    return curves
+
+
+def find_corners(points, tolerance, angle):
+    """Indices of the points where a polyline turns by more than angle.
+
+    Turns are measured on the polyline simplified to within tolerance,
+    so wiggles smaller than that are not taken for corners.
+    """
+    kept = simplify(points, tolerance)
+    chords = np.diff(points[kept], axis=0)
+    (before, after) = (chords[:-1], chords[1:])
+    cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+    turns = np.arctan2(cross, np.einsum('ij,ij->i', before, after))
+    return kept[1:-1][np.abs(turns) > angle]
+
+
+class CellFilter:
+    """Thins polylines arriving in chunks.
+
+    Of consecutive points falling into the same square cell only the
+    first is kept, so every point dropped lies within a cell diagonal of
+    a kept one. The diagonal is fraction times the largest extent of the
+    points seen so far; as that only grows, the first chunks are thinned
+    no coarser than the last. The last point of a stroke is always kept.
+    """
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+        self.low = np.full(2, np.inf)
+        self.high = np.full(2, -np.inf)
+        # Kept chunks, last kept and last seen point of every stroke.
+        self.kept = {}
+        self.last = {}
+        self.end = {}
+
+    def feed(self, stroke, chunk):
+        if len(chunk) == 0:
+            return
+        self.low = np.minimum(self.low, chunk.min(axis=0))
+        self.high = np.maximum(self.high, chunk.max(axis=0))
+        side = self.fraction * (self.high - self.low).max() / np.sqrt(2)
+        cells = np.floor(chunk / side) if side > 0 else chunk
+        keep = np.empty(len(chunk), dtype=bool)
+        keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+        last = self.last.get(stroke)
+        keep[0] = last is None or np.any(
+            (np.floor(last / side) if side > 0 else last) != cells[0])
+        kept = chunk[keep]
+        if len(kept):
+            self.kept.setdefault(stroke, []).append(kept)
+            self.last[stroke] = kept[-1]
+        self.end[stroke] = chunk[-1].copy()
+
+    def strokes(self):
+        """The kept points of every stroke, in the order they began."""
+        strokes = []
+        for (stroke, kept) in self.kept.items():
+            if np.any(self.last[stroke] != self.end[stroke]):
+                kept.append(self.end[stroke][np.newaxis])
+            strokes.append(np.concatenate(kept))
+        return strokes
+
+
+def csv_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yields the first two columns of the rows of a CSV file as
+    (0, points) pairs of at most chunk_size points each.
+
+    Columns are separated by commas or, if the first row has none, by
+    whitespace. A first row that is not numbers is taken for a header.
+    """
+    with open(path) as f:
+        first = f.readline()
+        delimiter = ',' if ',' in first else None
+        lines = [] if _is_header(first, delimiter) else [first]
+        while True:
+            lines.extend(islice(f, chunk_size - len(lines)))
+            if not lines:
+                return
+            if any(line.strip() for line in lines):
+                yield (0, np.loadtxt(lines, delimiter=delimiter,
+                                     usecols=(0, 1), ndmin=2))
+            lines = []
+
+
+def _is_header(line, delimiter):
+    try:
+        [float(field) for field in line.split(delimiter)[:2]]
+    except ValueError:
+        return True
+    return False
+
+
+def svg_chunks(path):
+    """Yields the points of every subpath of the paths in an SVG file as
+    (subpath, points) pairs. Transforms are not applied."""
+    stroke = 0
+    for (_, element) in ElementTree.iterparse(path):
+        if element.tag.rpartition('}')[2] == 'path':
+            for points in path_points(element.get('d', '')):
+                yield (stroke, points)
+                stroke += 1
+        element.clear()
+
+
+def path_points(d):
+    """Yields the points of every subpath of SVG path data.
+
+    Curves are flattened into FLATTEN_STEPS lines each and elliptical
+    arcs replaced by a line to their end. Every command is converted for
+    all of its argument groups at once.
+    """
+    current = start = np.zeros(2)
+    # The last control point of a C or S command, or of a Q or T one,
+    # reflected by a following S or T.
+    (cubic, quadratic) = (None, None)
+    pieces = []
+    for (command, text) in _commands(d):
+        upper = command.upper()
+        if upper == 'Z':
+            if pieces:
+                yield np.concatenate(pieces + [start[np.newaxis]])
+            (current, cubic, quadratic) = (start, None, None)
+            pieces = [start[np.newaxis]]
+            continue
+        args = np.array(_NUMBER.findall(text), dtype=np.float64)
+        arity = _ARITY[upper]
+        if len(args) == 0 or len(args) % arity:
+            raise ValueError('{} takes {} numbers'.format(command, arity))
+        args = args.reshape(-1, arity)
+        relative = command != upper
+        if upper in 'HV':
+            axis = 'HV'.index(upper)
+            coords = np.cumsum(args[:, 0]) + current[axis] if relative \
+                else args[:, 0]
+            ends = np.repeat(current[np.newaxis], len(coords), axis=0)
+            ends[:, axis] = coords
+        else:
+            ends = args[:, -2:]
+            if relative:
+                ends = current + np.cumsum(ends, axis=0)
+        starts = np.vstack((current, ends[:-1]))
+        if upper in 'CSQ':
+            controls = args[:, :-2].reshape(len(args), -1, 2)
+            if relative:
+                controls = controls + starts[:, np.newaxis]
+        (next_cubic, next_quadratic) = (None, None)
+        if upper == 'M':
+            if len(pieces) > 1 or (pieces and len(pieces[0]) > 1):
+                yield np.concatenate(pieces)
+            start = ends[0]
+            pieces = [ends]
+        elif upper in 'LHVA':
+            pieces.append(ends)
+        elif upper in 'CS':
+            if upper == 'S':
+                previous = np.vstack((
+                    cubic if cubic is not None else current,
+                    controls[:-1, 0]))
+                controls = np.concatenate(
+                    ((2 * starts - previous)[:, np.newaxis], controls),
+                    axis=1)
+            next_cubic = controls[-1, 1]
+            pieces.append(_flatten(starts, controls[:, 0], controls[:, 1],
+                                   ends))
+        else:
+            if upper == 'T':
+                points = []
+                control = quadratic if quadratic is not None else current
+                for point in starts:
+                    control = 2 * point - control
+                    points.append(control)
+                controls = np.array(points)[:, np.newaxis]
+            next_quadratic = controls[-1, 0]
+            pieces.append(_flatten(
+                starts, starts + 2 / 3 * (controls[:, 0] - starts),
+                ends + 2 / 3 * (controls[:, 0] - ends), ends))
+        (current, cubic, quadratic) = (ends[-1], next_cubic, next_quadratic)
+    if len(pieces) > 1 or (pieces and len(pieces[0]) > 1):
+        yield np.concatenate(pieces)
+
+
+def _commands(d):
+    """(command, arguments) pairs of path data. Consecutive commands of
+    one kind other than M are joined, as their arguments may be."""
+    (command, texts) = (None, [])
+    for (letter, text) in _COMMAND.findall(d):
+        if letter != command or letter in 'Mm':
+            if command is not None:
+                yield (command, ' '.join(texts))
+            (command, texts) = (letter, [])
+        texts.append(text)
+    if command is not None:
+        yield (command, ' '.join(texts))
+
+
+def _flatten(starts, first, second, ends):
+    controls = np.stack((starts, first, second, ends), axis=1)
+    return np.einsum('mi,kid->kmd', _FLATTEN_BASIS, controls).reshape(-1, 2)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from utils import _BLOCK_SIZE
+
+
+class BarycentricInterpolator:
+    """Polynomial interpolation in the barycentric Lagrange form.
+
+    The weights depend only on the nodes, so they are shared by every
+    coordinate and survive any change of the interpolated values.
+    Adding or removing the last node updates them in O(n). Weights are
+    stored rescaled so their largest magnitude is 1, which keeps them
+    finite for many nodes; the barycentric formula is invariant to that
+    scaling.
+    """
+
+    def __init__(self, nodes=()):
+        self.nodes = np.empty(0)
+        self.weights = np.empty(0)
+        # The true weights are self.weights * exp(self.log_scale).
+        self.log_scale = 0.0
+        for x in nodes:
+            self.add_node(x)
+
+    def add_node(self, x):
+        diff = x - self.nodes
+        weights = self.weights / -diff
+        log_new = -np.sum(np.log(np.abs(diff))) - self.log_scale
+        sign = -1.0 if np.count_nonzero(diff < 0) % 2 else 1.0
+        log_max = log_new
+        if len(weights):
+            log_max = max(log_max, np.log(np.max(np.abs(weights))))
+        self.nodes = np.append(self.nodes, x)
+        self.weights = np.append(weights * np.exp(-log_max),
+                                 sign * np.exp(log_new - log_max))
+        self.log_scale += log_max
+
+    def remove_node(self):
+        """Drops the last node, undoing add_node."""
+        diff = self.nodes[:-1] - self.nodes[-1]
+        weights = self.weights[:-1] * diff
+        self.nodes = self.nodes[:-1]
+        if len(weights):
+            log_max = np.log(np.max(np.abs(weights)))
+            self.weights = weights * np.exp(-log_max)
+            self.log_scale += log_max
+        else:
+            (self.weights, self.log_scale) = (weights, 0.0)
+
+    def evaluate(self, values, xs):
+        """Interpolates the values given at the nodes at every x in xs.
+
+        values is either one value per node or an (n, k) array, in which
+        case every column is interpolated with the same weights.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.ndim == 1
+        values = values.reshape(len(self.nodes), -1)
+        xs = np.asarray(xs, dtype=np.float64)
+        result = np.empty((len(xs), values.shape[1]))
+        chunk = max(1, _BLOCK_SIZE // max(1, len(self.nodes)))
+        for start in range(0, len(xs), chunk):
+            diff = xs[start:start + chunk, np.newaxis] - self.nodes
+            (rows, cols) = np.nonzero(diff == 0.0)
+            diff[rows, cols] = 1.0
+            terms = self.weights / diff
+            with np.errstate(divide='ignore', invalid='ignore'):
+                block = (terms @ values) / terms.sum(axis=1)[:, np.newaxis]
+            # Parameters that hit a node exactly take its value.
+            block[rows] = values[cols]
+            result[start:start + chunk] = block
+        return result[:, 0] if flat else result
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""Crash-safe autosave through an append-only edit journal.
+
+The journal is a text file with one JSON-encoded operation per line. It
+always starts with a base: either ['new'] for an empty board or
+['load', name] naming a document file, beside the journal, to start
+from. A document the journal starts from is copied there first, so
+editing or deleting the original cannot change what is replayed. Edits
+are buffered and appended in small batches. When the journal grows long
+it is compacted: the current curves are written to a new base and the
+journal restarts with a 'load' of it.
+
+Every editor process writes its own journal and holds a lock on it, so
+only the journals of processes that are gone are offered for recovery.
+"""
+
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+from PyQt5.QtCore import QLockFile
+
+from curve import Curve
+from document import (save_document, LazyCurves)
+
+
+class EditJournal:
+    def __init__(self, path, batch_size=64, compact_after=5000):
+        self.path = path
+        # The base alternates between two files, so the one the journal
+        # names is only removed once the journal names the other.
+        self.base_paths = (path + '.base0', path + '.base1')
+        self.lock = None
+        self.batch_size = batch_size
+        self.compact_after = compact_after
+        self.pending = []
+        self.ops_written = 0
+
+    def acquire(self):
+        """Locks the journal for this process; returns False if a running
+        process holds it."""
+        lock = QLockFile(self.path + '.lock')
+        # A lock is stale only once its owner is gone, however old it is.
+        lock.setStaleLockTime(0)
+        if not lock.tryLock(0):
+            return False
+        self.lock = lock
+        return True
+
+    def release(self):
+        if self.lock is not None:
+            self.lock.unlock()
+            self.lock = None
+
+    def has_unsaved(self):
+        """Whether the journal on disk holds edits beyond its base."""
+        return len(self.read()) > 1
+
+    def record(self, *op):
+        op = list(op)
+        # Consecutive moves of the same point only need the last position.
+        if (op[0] == 'move' and self.pending and
+                self.pending[-1][:3] == op[:3]):
+            self.pending[-1] = op
+        else:
+            self.pending.append(op)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        lines = ''.join(json.dumps(op, default=_encode) + '\n'
+                        for op in self.pending)
+        with open(self.path, 'a') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.ops_written += len(self.pending)
+        self.pending = []
+
+    def needs_compaction(self):
+        return self.ops_written + len(self.pending) >= self.compact_after
+
+    def reset(self, base=None):
+        """Restarts the journal from a copy of a document file, or from
+        scratch."""
+        self._restart(base and (lambda path: _copy_file(base, path)))
+
+    def compact(self, curves, active=None):
+        self._restart(lambda path: save_document(path, curves, active))
+        self.record('select', active)
+
+    def _restart(self, write_base):
+        self.pending = []
+        self.ops_written = 0
+        old = self.base()
+        new = None
+        if write_base is not None:
+            new = next(path for path in self.base_paths if path != old)
+            write_base(new)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            op = ['load', os.path.basename(new)] if new else ['new']
+            f.write(json.dumps(op) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if old is not None and old != new and os.path.exists(old):
+            os.remove(old)
+
+    def base(self):
+        """The document file the journal starts from, if any."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            try:
+                op = json.loads(f.readline())
+            except ValueError:
+                return None
+        if op[0] != 'load':
+            return None
+        return os.path.join(os.path.dirname(self.path), op[1])
+
+    def discard(self):
+        """Removes the journal and its bases and gives up its lock."""
+        self.pending = []
+        for path in (self.path,) + self.base_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.release()
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        ops = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    # A batch cut short by a crash; nothing after it counts.
+                    break
+        return ops
+
+    def recover(self):
+        """Replays the journal up to the first operation that fails.
+
+        Returns the curves, the active name and the error that stopped
+        the replay, or None if every operation was applied.
+        """
+        curves = {}
+        active = None
+        for op in self.read():
+            if op[0] == 'load':
+                op = ['load', os.path.join(os.path.dirname(self.path),
+                                           op[1])]
+            try:
+                (curves, active) = apply_op(curves, active, op)
+            except Exception as e:
+                return (curves, active if active in curves else None,
+                        '{}: {!r}'.format(op[0], e))
+        return (curves, active, None)
+
+
+def orphaned_journals(directory):
+    """Locks and returns the journals in directory whose owners are no
+    longer running."""
+    journals = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.journal'))):
+        journal = EditJournal(path)
+        if journal.acquire():
+            journals.append(journal)
+    return journals
+
+
+def apply_op(curves, active, op):
+    (kind, args) = (op[0], op[1:])
+    if kind == 'new':
+        return ({}, None)
+    if kind == 'load':
+        loaded = LazyCurves(args[0])
+        return (dict(loaded.items()), loaded.active)
+    if kind == 'select':
+        return (curves, args[0])
+    if kind == 'add_curve':
+        (name, ctype) = args
+        curves[name] = Curve(ctype=ctype)
+        return (curves, name)
+    if kind == 'remove':
+        curves.pop(args[0], None)
+        return (curves, None if active == args[0] else active)
+    if kind == 'restore':
+        (name, state) = args
+        curves[name] = Curve.from_state(state)
+        return (curves, active)
+    if kind == 'rename':
+        (old, new) = args
+        curves[new] = curves.pop(old)
+        return (curves, new if active == old else active)
+    curve = curves[args[0]]
+    if kind in ('move', 'remove_point', 'weight'):
+        _check_indices(curve, [args[1]])
+    elif kind in ('place', 'transform'):
+        _check_indices(curve, args[1])
+    if kind == 'add_point':
+        curve.add_point(*args[1:])
+    elif kind == 'move':
+        curve.move_point_to(*args[1:])
+    elif kind == 'remove_point':
+        curve.remove_point(args[1])
+    elif kind == 'place':
+        curve.restore_points(*args[1:])
+    elif kind == 'transform':
+        curve.transform_points(*args[1:])
+    elif kind == 'hull':
+        curve.toggle_hull(args[1])
+    elif kind == 'guide':
+        curve.toggle_guide(args[1])
+    elif kind == 'rational':
+        curve.set_rational(args[1])
+    elif kind == 'weight':
+        curve.set_weight(*args[1:])
+    elif kind == 'continuity':
+        curve.set_continuity(args[1])
+    elif kind == 'convert':
+        curve.convert_to_bezier_spline(args[1])
+    elif kind == 'shape':
+        curve.set_shape(args[1])
+    return (curves, active)
+
+
+def _check_indices(curve, indices):
+    # Curves keep spare room past their last point, so a journal that does
+    # not match its base would write there without an error.
+    for i in indices:
+        if not 0 <= i < curve.points_no:
+            raise IndexError('no point {} in {} points'.format(
+                i, curve.points_no))
+
+
+def _copy_file(source, path):
+    with open(source, 'rb') as src, open(path, 'wb') as f:
+        shutil.copyfileobj(src, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _encode(value):
+    # Restored curves and shapes carry whole point arrays.
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(type(value).__name__)
@@ -1,16 +1,38 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import logging
 import sys
 from PyQt5.QtWidgets import QApplication
 
 from main_widget import MainWidget
+from metrics import metrics
 
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='Simple curve editor.')
+    parser.add_argument('--log-level', default='warning',
+                        choices=('debug', 'info', 'warning', 'error'))
+    parser.add_argument('--profile', metavar='PATH',
+                        help='collect metrics and write them here as JSON '
+                             'on exit')
+    parser.add_argument('--hud', action='store_true',
+                        help='show frame timing over the board')
+    # Whatever is left is for Qt.
+    (args, qtArgs) = parser.parse_known_args()
+    logging.basicConfig(level=args.log_level.upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    metrics.enabled = bool(args.profile or args.hud)
+
+    app = QApplication(sys.argv[:1] + qtArgs)
 
     widget = MainWidget()
-    sys.exit(app.exec_())
+    if args.hud:
+        widget.hudAction.setChecked(True)
+    status = app.exec_()
+    if args.profile:
+        metrics.dump(args.profile)
+    sys.exit(status)
     widget = widget
 
 if __name__ == '__main__':
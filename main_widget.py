@@ -2,19 +2,30 @@
 
 from PyQt5.QtWidgets import (QWidget, QToolTip, QMessageBox, QInputDialog,
                              QDesktopWidget, QMainWindow, QAction, qApp, QMenu,
-                             QHBoxLayout, QSizePolicy)
+                             QHBoxLayout, QSizePolicy, QActionGroup)
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import (QIcon, QFont, QColor)
-import pickle
+import os
+import time
 
 from drawing_board import DrawingBoard
 from communications import Communications
 from function_bar import FunctionBar
+from document import (save_document, LazyCurves, DocumentError)
+from importer import (import_curves, PointCloudError)
+from journal import (EditJournal, orphaned_journals)
+from rendering import renderImage
+from metrics import (log, metrics, instrument_signals)
+
+AUTOSAVE_DIR = os.path.join(os.path.expanduser('~'), '.curveminator')
+AUTOSAVE_INTERVAL = 2000
 
 
 class MainWidget(QMainWindow):
     def __init__(self):
         QWidget.__init__(self)
         self.c = Communications()
+        self.signalsCounted = False
         self.initUI()
 
     def initUI(self):
@@ -44,9 +55,15 @@ class MainWidget(QMainWindow):
         saveAction.setShortcut('Ctrl+S')
         saveAction.triggered.connect(self.saveState)
 
+        importAction = QAction('Import points', self)
+        importAction.setShortcut('Ctrl+I')
+        importAction.triggered.connect(self.importPoints)
+
         exportMenu = QMenu('Export image', self)
         pngAction = QAction('PNG', self)
+        pngAction.triggered.connect(lambda: self.exportImage('png'))
         jpgAction = QAction('JPG', self)
+        jpgAction.triggered.connect(lambda: self.exportImage('jpg'))
         exportMenu.addAction(pngAction)
         exportMenu.addAction(jpgAction)
 
@@ -59,23 +76,92 @@ class MainWidget(QMainWindow):
         fileMenu.addAction(newAction)
         fileMenu.addAction(openAction)
         fileMenu.addAction(saveAction)
+        fileMenu.addAction(importAction)
         fileMenu.addMenu(exportMenu)
         fileMenu.addAction(exitAction)
 
+        editMenu = menubar.addMenu('Edit')
+        undoAction = QAction('Undo', self)
+        undoAction.setShortcut('Ctrl+Z')
+        undoAction.triggered.connect(self.board.undo)
+        redoAction = QAction('Redo', self)
+        redoAction.setShortcut('Ctrl+Shift+Z')
+        redoAction.triggered.connect(self.board.redo)
+        editMenu.addAction(undoAction)
+        editMenu.addAction(redoAction)
+        editMenu.addSeparator()
+        selectAllAction = QAction('Select all points', self)
+        selectAllAction.setShortcut('Ctrl+A')
+        selectAllAction.triggered.connect(self.board.selectAll)
+        clearSelectionAction = QAction('Clear selection', self)
+        clearSelectionAction.setShortcut('Esc')
+        clearSelectionAction.triggered.connect(self.board.clearSelection)
+        editMenu.addAction(selectAllAction)
+        editMenu.addAction(clearSelectionAction)
+        editMenu.addSeparator()
+        for (label, transform) in (
+                ('Rotate 15° clockwise',
+                 lambda: self.board.rotateSelection(15)),
+                ('Rotate 15° counterclockwise',
+                 lambda: self.board.rotateSelection(-15)),
+                ('Enlarge by 10%', lambda: self.board.scaleSelection(1.1)),
+                ('Shrink by 10%', lambda: self.board.scaleSelection(1 / 1.1)),
+                ('Mirror horizontally',
+                 lambda: self.board.scaleSelection(-1, 1)),
+                ('Mirror vertically',
+                 lambda: self.board.scaleSelection(1, -1))):
+            action = QAction(label, self)
+            action.triggered.connect(transform)
+            editMenu.addAction(action)
+
+        viewMenu = menubar.addMenu('View')
+        self.hudAction = QAction('Frame timing', self)
+        self.hudAction.setShortcut('F3')
+        self.hudAction.setCheckable(True)
+        self.hudAction.toggled.connect(self.toggleHud)
+        viewMenu.addAction(self.hudAction)
+        resetViewAction = QAction('Reset view', self)
+        resetViewAction.setShortcut('Ctrl+0')
+        resetViewAction.triggered.connect(self.board.resetView)
+        viewMenu.addAction(resetViewAction)
+
         curveMenu = menubar.addMenu('New curve')
         interpAction = QAction('Interpolated curve', self)
         nSplineAction = QAction('N-Spline', self)
         pSplineAction = QAction('P-Spline', self)
         bezierAction = QAction('Bézier curve', self)
+        bSplineAction = QAction('Bézier spline', self)
         curveMenu.addAction(interpAction)
         curveMenu.addAction(nSplineAction)
         curveMenu.addAction(pSplineAction)
         curveMenu.addAction(bezierAction)
+        curveMenu.addAction(bSplineAction)
 
         bezierAction.triggered.connect(self.board.addBCurve)
         interpAction.triggered.connect(self.board.addICurve)
         nSplineAction.triggered.connect(self.board.addNSCurve)
         pSplineAction.triggered.connect(self.board.addPSCurve)
+        bSplineAction.triggered.connect(self.board.addBSCurve)
+
+        splineMenu = menubar.addMenu('Bézier spline')
+        self.continuityActions = {}
+        continuityGroup = QActionGroup(self)
+        for (continuity, label) in (('none', 'No continuity'),
+                                    ('g1', 'G1 continuity'),
+                                    ('c1', 'C1 continuity')):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.triggered.connect(
+                lambda checked, continuity=continuity:
+                self.board.setContinuity(continuity))
+            continuityGroup.addAction(action)
+            splineMenu.addAction(action)
+            self.continuityActions[continuity] = action
+        splineMenu.addSeparator()
+        convertAction = QAction('Convert Bézier curve', self)
+        convertAction.triggered.connect(self.board.convertToSpline)
+        splineMenu.addAction(convertAction)
+        splineMenu.aboutToShow.connect(self.showContinuity)
 
         # SET UP DRAWING SPACE AND TOOLBAR
         mainLayout = QHBoxLayout()
@@ -95,7 +181,7 @@ class MainWidget(QMainWindow):
         mainLayout.addWidget(self.functionBar)
         homeWidget.setLayout(mainLayout)
         self.c.updateStatusBar.connect(self.updateStatusBar)
-        self.c.updateSelectedPoint.connect(self.functionBar.updateSelectedPoint)
+        self.c.modelChanged.connect(self.functionBar.modelChanged)
         self.c.cyclePoint.connect(self.board.cyclePoint)
         self.c.gotoPoint.connect(self.board.gotoPoint)
         self.c.moveXPoint.connect(self.board.moveXPoint)
@@ -104,14 +190,88 @@ class MainWidget(QMainWindow):
         self.c.moveYPointTo.connect(self.board.moveYPointTo)
         self.c.toggleHull.connect(self.board.toggleHull)
         self.c.toggleGuide.connect(self.board.toggleGuide)
+        self.c.toggleWeights.connect(self.board.toggleWeights)
+        self.c.changeWeight.connect(self.board.changeWeight)
         self.c.addCurve.connect(self.functionBar.addCurve)
         self.c.removeCurve.connect(self.board.removeCurve)
         self.c.selectCurve.connect(self.board.selectCurve)
         self.c.selectedCurveName.connect(self.functionBar.selectedCurveName)
+        self.c.curveRemoved.connect(self.functionBar.curveRemoved)
+        self.c.curveRenamed.connect(self.functionBar.curveRenamed)
         self.c.renameCurve.connect(self.board.renameCurve)
         self.board.connectEvents(self.c)
         self.functionBar.connectEvents(self.c)
+        if metrics.enabled:
+            self.countSignals()
         self.show()
+        self.initAutosave()
+
+    def initAutosave(self):
+        os.makedirs(AUTOSAVE_DIR, exist_ok=True)
+        recovered = None
+        for orphan in orphaned_journals(AUTOSAVE_DIR):
+            if recovered is not None:
+                # One recovery per start; the rest wait for the next one.
+                orphan.release()
+                continue
+            recovered = self.recoverJournal(orphan)
+            orphan.discard()
+        # The start time tells journals of a reused process id apart.
+        journal = EditJournal(os.path.join(AUTOSAVE_DIR,
+                                           'autosave-{}-{}.journal'.format(
+                                               os.getpid(), int(time.time()))))
+        journal.acquire()
+        if recovered is not None:
+            self.board.loadCurves(*recovered)
+            journal.compact(recovered[0], self.board.activeCurve)
+        else:
+            journal.reset()
+        self.board.journal = journal
+        self.autosaveTimer = QTimer(self)
+        self.autosaveTimer.timeout.connect(self.autosave)
+        self.autosaveTimer.start(AUTOSAVE_INTERVAL)
+
+    def recoverJournal(self, journal):
+        """Offers to replay the journal of an editor that did not quit;
+        returns the curves and active name to open, or None."""
+        try:
+            if not journal.has_unsaved():
+                return None
+            reply = QMessageBox.question(self, 'Recover',
+                                         "Recover unsaved work?",
+                                         QMessageBox.Yes | QMessageBox.No,
+                                         QMessageBox.Yes)
+            if reply != QMessageBox.Yes:
+                return None
+            (curves, active, error) = journal.recover()
+        except Exception:
+            log.exception('could not recover %s', journal.path)
+            QMessageBox.warning(self, 'Recover',
+                                "The unsaved work could not be read.")
+            return None
+        if error is not None:
+            log.warning('replay of %s stopped at %s', journal.path, error)
+            if not curves:
+                QMessageBox.warning(self, 'Recover',
+                                    "The unsaved work could not be "
+                                    "recovered:\n" + error)
+                return None
+            reply = QMessageBox.question(
+                self, 'Recover',
+                "Only part of the unsaved work could be recovered; replay "
+                "stopped at\n{}\nOpen what was recovered?".format(error),
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply != QMessageBox.Yes:
+                return None
+        return (curves, active) if curves else None
+
+    def autosave(self):
+        journal = self.board.journal
+        self.board.flushEdits()
+        if journal.needs_compaction():
+            journal.compact(self.board.curves, self.board.activeCurve)
+        else:
+            journal.flush()
 
     def updateStatusBar(self, text):
         self.statusBar().showMessage(text)
@@ -128,6 +288,7 @@ class MainWidget(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No,
                                      QMessageBox.No)
         if reply == QMessageBox.Yes:
+            self.board.journal.discard()
             event.accept()
         else:
             event.ignore()
@@ -138,20 +299,69 @@ class MainWidget(QMainWindow):
     def saveState(self):
         text, ok = QInputDialog.getText(self, 'Input Dialog',
                                         'Enter filename:')
-        if ok:
-            fname = str(text)
-        f = open(fname, 'wb')
-        pickle.dump(self.board.curves, f)
-        f.close()
+        if not ok:
+            return
+        self.board.flushEdits()
+        save_document(str(text), self.board.curves, self.board.activeCurve)
+        self.board.journal.reset(os.path.abspath(str(text)))
+
+    def importPoints(self):
+        text, ok = QInputDialog.getText(self, 'Input Dialog',
+                                        'Enter filename:')
+        if not ok:
+            return
+        self.board.flushEdits()
+        # The points are fitted into the view to within a pixel.
+        tolerance = 1.0 / max(self.board.pixelScale())
+        try:
+            curves = import_curves(str(text), self.board.visibleBounds(-20),
+                                   tolerance)
+        except (OSError, PointCloudError) as e:
+            QMessageBox.warning(self, 'Import points', str(e))
+            return
+        name = os.path.splitext(os.path.basename(str(text)))[0]
+        self.board.importCurves(curves, name)
+        log.info('imported %d curves from %s', len(curves), text)
+
+    def exportImage(self, fmt):
+        text, ok = QInputDialog.getText(self, 'Input Dialog',
+                                        'Enter filename:')
+        if not ok:
+            return
+        self.board.flushEdits()
+        image = renderImage(self.board.curves, self.board.activeCurve,
+                            self.board.width(), self.board.height())
+        if not image.save(str(text), fmt.upper()):
+            QMessageBox.warning(self, 'Export image',
+                                'Could not write {}'.format(text))
+
+    def showContinuity(self):
+        curve = self.board.curves.get(self.board.activeCurve)
+        for action in self.continuityActions.values():
+            action.setEnabled(curve is not None)
+        if curve is not None:
+            self.continuityActions[curve.continuity].setChecked(True)
+
+    def toggleHud(self, hud):
+        self.board.setHud(hud)
+        if hud:
+            self.countSignals()
+
+    def countSignals(self):
+        if not self.signalsCounted:
+            instrument_signals(self.c)
+            self.signalsCounted = True
 
     def loadState(self):
         text, ok = QInputDialog.getText(self, 'Input Dialog',
                                         'Enter filename:')
-        if ok:
-            fname = str(text)
-        f = open(fname, 'rb')
-        self.board.loadCurves(pickle.load(f))
-        print(self.board.curves)
-        print(self.board.curves['Curve 1'].plot)
-        print(self.board.curves['Curve 1'].points)
-        f.close()
+        if not ok:
+            return
+        try:
+            curves = LazyCurves(str(text))
+        except (OSError, DocumentError) as e:
+            QMessageBox.warning(self, 'Open', str(e))
+            return
+        self.board.loadCurves(curves, curves.active)
+        self.board.journal.reset(os.path.abspath(str(text)))
+        log.info('opened %s with %d curves', text, len(curves))
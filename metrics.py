@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Logging and counters for the hot paths.
+
+log is the editor's standard logger; messages below the configured level
+are dropped before they are formatted. metrics collects counters, timers
+and cache hits while enabled; while disabled every call only checks a
+flag. Updates may come from the plot worker threads.
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from PyQt5.QtCore import pyqtSignal
+
+log = logging.getLogger('curveminator')
+
+_NO_TIMER = nullcontext()
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.counters = {}
+        # name -> [count, total, shortest, longest] in seconds
+        self.timers = {}
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = min(timer[2], seconds)
+                timer[3] = max(timer[3], seconds)
+
+    def timed(self, name):
+        """Context manager adding the time spent in it to a timer."""
+        if not self.enabled:
+            return _NO_TIMER
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def hit(self, cache, is_hit):
+        self.count(cache + ('.hits' if is_hit else '.misses'))
+
+    def hit_rate(self, cache):
+        hits = self.counters.get(cache + '.hits', 0)
+        total = hits + self.counters.get(cache + '.misses', 0)
+        return hits / total if total else None
+
+    def timer_stats(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            return None
+        (count, total, shortest, longest) = timer
+        return {'count': count, 'total': total, 'mean': total / count,
+                'min': shortest, 'max': longest}
+
+    def profile(self):
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: self.timer_stats(name) for name in self.timers}
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.localtime(self.started)),
+                'duration': time.time() - self.started,
+                'counters': counters, 'timers': timers}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.profile(), f, indent=1, sort_keys=True)
+        log.info('profile written to %s', path)
+
+
+metrics = Metrics()
+
+
+def instrument_signals(communications):
+    """Counts the emissions of every signal of a Communications object."""
+    for (name, signal) in vars(type(communications)).items():
+        if isinstance(signal, pyqtSignal):
+            getattr(communications, name).connect(
+                lambda *args, name=name: metrics.count('signals.' + name))
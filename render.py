@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Renders curve documents to image files without a window.
+
+    python render.py [-o DIR] [-f png|jpg|svg] [-s WIDTHxHEIGHT]
+                     [-j JOBS] [--no-points] DOCUMENT...
+
+Documents are spread over a pool of worker processes, each of which
+draws offscreen with the same code the editor uses. Images are written
+under DIR in the directory layout the documents have below their common
+parent directory.
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import (ProcessPoolExecutor, as_completed)
+
+from document import LazyCurves
+from rendering import (renderImage, renderSvg, ensureApplication)
+
+FORMATS = ('png', 'jpg', 'svg')
+
+
+def renderDocument(path, outPath, fmt, width, height, points=True):
+    ensureApplication()
+    os.makedirs(os.path.dirname(outPath) or '.', exist_ok=True)
+    curves = LazyCurves(path)
+    if fmt == 'svg':
+        renderSvg(outPath, curves, curves.active, width, height, points)
+    elif not renderImage(curves, curves.active, width, height,
+                         points).save(outPath, fmt.upper()):
+        raise IOError('could not write {}'.format(outPath))
+    return outPath
+
+
+def outputPaths(paths, outDir, fmt):
+    """Output files for the documents, laid out under outDir as the
+    documents are under their deepest common directory, so documents of
+    the same name in different directories do not overwrite each other.
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    if not paths:
+        return []
+    common = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return [os.path.join(outDir, '{}.{}'.format(
+        os.path.splitext(os.path.relpath(path, common))[0], fmt))
+        for path in paths]
+
+
+def parseSize(text):
+    try:
+        (width, height) = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WIDTHxHEIGHT')
+    return (width, height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render curve documents to images.')
+    parser.add_argument('documents', nargs='+')
+    parser.add_argument('-o', '--output', default='.',
+                        help='output directory')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png')
+    parser.add_argument('-s', '--size', type=parseSize, default=(800, 600),
+                        help='image size as WIDTHxHEIGHT')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--no-points', dest='points', action='store_false',
+                        help='leave out the control points')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    (width, height) = args.size
+    outPaths = outputPaths(args.documents, args.output, args.format)
+    clashes = [outPath for (outPath, count) in Counter(outPaths).items()
+               if count > 1]
+    if clashes:
+        parser.error('several documents would be written to {}'.format(
+            ', '.join(sorted(clashes))))
+    tasks = [(path, outPath, args.format, width, height, args.points)
+             for (path, outPath) in zip(args.documents, outPaths)]
+    failed = 0
+    if args.jobs <= 1:
+        for task in tasks:
+            try:
+                renderDocument(*task)
+            except Exception as e:
+                failed += 1
+                print('{}: {}'.format(task[0], e), file=sys.stderr)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {pool.submit(renderDocument, *task): task[0]
+                       for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print('{}: {}'.format(futures[future], e),
+                          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
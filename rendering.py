@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""Drawing code shared by the board, image export and the batch renderer."""
+
+import sys
+
+from PyQt5.QtCore import (Qt, QPointF, QRectF, QRect, QSize)
+from PyQt5.QtGui import (QColor, QPen, QTransform, QImage, QPainter,
+                         QStaticText)
+import numpy as np
+
+from curve import to_polygon
+
+MARKER_RADIUS = 5
+# Below this many square pixels of screen per visible point, the point
+# labels would only clutter it and are left out.
+LABEL_AREA = 100
+
+_labels = {}
+_app = None
+
+
+def ensureApplication(widgets=False):
+    """Creates an offscreen application if there is none; text drawing
+    needs a QGuiApplication, widgets a QApplication."""
+    global _app
+    if widgets:
+        from PyQt5.QtWidgets import QApplication as Application
+    else:
+        from PyQt5.QtGui import QGuiApplication as Application
+    if Application.instance() is None:
+        _app = Application([sys.argv[0], '-platform', 'offscreen'])
+
+
+def viewTransform(width, height, zoom=1.0, origin=(0.0, 0.0)):
+    """Maps model coordinates onto a widget; the model point origin
+    lands 5 pixels in from the top left corner and the unit square
+    covers the widget at zoom 1."""
+    (scx, scy) = (width * zoom, height * zoom)
+    return QTransform(scx, 0, 0, scy, 5 - origin[0] * scx,
+                      5 - origin[1] * scy)
+
+
+def cosmeticPen(color):
+    pen = QPen(color)
+    pen.setCosmetic(True)
+    return pen
+
+
+def markerPen(color, width):
+    pen = QPen(color, width)
+    pen.setCapStyle(Qt.RoundCap)
+    return pen
+
+
+def mapPoints(transform, points):
+    """Maps an (n, 2) array of points through an affine QTransform."""
+    linear = np.array([[transform.m11(), transform.m12()],
+                       [transform.m21(), transform.m22()]])
+    return points @ linear + (transform.dx(), transform.dy())
+
+
+def labelText(i):
+    """The label of point i, laid out once and kept."""
+    text = _labels.get(i)
+    if text is None:
+        text = _labels[i] = QStaticText(str(i))
+    return text
+
+
+def drawInactive(painter, curves):
+    """Draws the plots of the given curves in grey; expects the painter
+    to carry the view transform."""
+    painter.setPen(cosmeticPen(QColor(120, 120, 120)))
+    for curve in curves:
+        painter.drawPolyline(curve.plot)
+
+
+def drawActive(painter, curve, transform, selected=None, points=True,
+               marked=()):
+    """Draws the active curve with its hull, guide and control points;
+    selected is the current point, marked the other selected ones."""
+    painter.setTransform(transform)
+    if curve.is_hull:
+        painter.setPen(cosmeticPen(QColor(0, 0, 255)))
+        painter.drawPolygon(curve.hull)
+    if curve.is_guide:
+        painter.setPen(cosmeticPen(QColor(255, 0, 0)))
+        painter.drawPolyline(curve.guide)
+    #  potem aktywna
+    painter.setPen(cosmeticPen(QColor(0, 0, 0)))
+    painter.drawPolyline(curve.plot)
+    painter.resetTransform()
+    if not points:
+        return
+
+    #  potem zaznaczone punkty
+    pixels = mapPoints(transform, curve.points)
+    view = QRectF(painter.viewport()).adjusted(
+        -MARKER_RADIUS, -MARKER_RADIUS, MARKER_RADIUS, MARKER_RADIUS)
+    visible = np.flatnonzero((pixels[:, 0] >= view.left()) &
+                             (pixels[:, 0] <= view.right()) &
+                             (pixels[:, 1] >= view.top()) &
+                             (pixels[:, 1] <= view.bottom()))
+    if marked:
+        painter.setPen(QPen(QColor(255, 128, 0)))
+        shown = np.intersect1d(visible, np.fromiter(marked, dtype=np.intp))
+        painter.drawRects([QRectF(x - 5, y - 5, 10, 10)
+                           for (x, y) in pixels[shown].tolist()])
+    if selected is not None:
+        painter.setPen(QPen(QColor(255, 0, 0)))
+        (x, y) = pixels[selected]
+        painter.drawRect(QRectF(x - 5, y - 5, 10, 10))
+
+    #  i same punkty
+    drawMarkers(painter, pixels[visible])
+    if len(visible) * LABEL_AREA <= view.width() * view.height():
+        drawLabels(painter, visible, pixels[visible])
+
+
+def drawMarkers(painter, pixels):
+    """Draws a circle at every pixel position with two batched calls:
+    round points of the outline's size, then of the fill's."""
+    polygon = to_polygon(pixels)
+    painter.setPen(markerPen(QColor(0, 0, 0), 2 * MARKER_RADIUS + 1))
+    painter.drawPoints(polygon)
+    painter.setPen(markerPen(QColor(0, 154, 0), 2 * MARKER_RADIUS - 1))
+    painter.drawPoints(polygon)
+
+
+def drawLabels(painter, indices, pixels):
+    """Labels points with their indices, below and to the right.
+
+    The screen is divided into cells the size of the longest label and
+    only the lowest index in each cell is labelled, so labels seldom
+    overlap.
+    """
+    if len(indices) == 0:
+        return
+    font = painter.fontMetrics()
+    cell = (font.width(str(indices[-1])) + 4, font.height())
+    cells = np.floor(pixels / cell).astype(np.int64)
+    (_, first) = np.unique(cells, axis=0, return_index=True)
+    first.sort()
+    # drawText put the baseline 15 pixels below the point.
+    offset = QPointF(MARKER_RADIUS, 15 - font.ascent())
+    painter.setPen(QPen(QColor(0, 0, 0)))
+    for (i, (x, y)) in zip(indices[first].tolist(), pixels[first].tolist()):
+        painter.drawStaticText(QPointF(x, y) + offset, labelText(i))
+
+
+def renderCurves(painter, curves, active, width, height, points=True):
+    """Draws a whole document the way the board shows it.
+
+    Plots are computed synchronously, so this works without a window
+    or an event loop.
+    """
+    transform = viewTransform(width, height)
+    for curve in curves.values():
+        curve.make_plot(width, height)
+    painter.setTransform(transform)
+    drawInactive(painter, (curve for (name, curve) in curves.items()
+                           if name != active))
+    if active is not None:
+        drawActive(painter, curves[active], transform, points=points)
+
+
+def renderImage(curves, active, width, height, points=True):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(Qt.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    renderCurves(painter, curves, active, width, height, points)
+    painter.end()
+    return image
+
+
+def renderSvg(path, curves, active, width, height, points=True):
+    from PyQt5.QtSvg import QSvgGenerator
+    generator = QSvgGenerator()
+    generator.setFileName(path)
+    generator.setSize(QSize(width, height))
+    generator.setViewBox(QRect(0, 0, width, height))
+    painter = QPainter(generator)
+    painter.fillRect(QRect(0, 0, width, height), Qt.white)
+    renderCurves(painter, curves, active, width, height, points)
+    painter.end()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+from math import floor
+
+import numpy as np
+
+from tessellation import chord_deviation
+
+
+CELL_SIZE = 1.0 / 64
+
+
+def cell_of(x, y):
+    return (floor(x / CELL_SIZE), floor(y / CELL_SIZE))
+
+
+def cells_around(x, y, scx, scy, radius):
+    """Grid cells covering the pixel radius around a model point."""
+    (x0, y0) = cell_of(x - radius / scx, y - radius / scy)
+    (x1, y1) = cell_of(x + radius / scx, y + radius / scy)
+    return ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+
+
+class PointGrid:
+    """Uniform grid over the control points of one curve.
+
+    Points are filed under the cell they fall into, so a pick only
+    looks at the few cells around the cursor.
+    """
+
+    def __init__(self):
+        self.cells = defaultdict(set)
+
+    def insert(self, i, point):
+        self.cells[cell_of(*point)].add(i)
+
+    def move(self, i, old, new):
+        (old_cell, new_cell) = (cell_of(*old), cell_of(*new))
+        if old_cell != new_cell:
+            self.remove(i, old)
+            self.cells[new_cell].add(i)
+
+    def remove(self, i, point):
+        cell = cell_of(*point)
+        self.cells[cell].discard(i)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def nearest(self, points, x, y, scx, scy, radius):
+        """Index of the point closest to (x, y) within radius pixels."""
+        best = None
+        best_dist = radius
+        for cell in cells_around(x, y, scx, scy, radius):
+            for i in self.cells.get(cell, ()):
+                (px, py) = points[i]
+                dist = ((scx * (px - x)) ** 2 + (scy * (py - y)) ** 2) ** 0.5
+                if dist < best_dist:
+                    (best, best_dist) = (i, dist)
+        return best
+
+
+class SegmentGrid:
+    """Uniform grid over the plot segments of all curves on the board.
+
+    Each cell maps a curve to the indices of its plot segments whose
+    bounding box touches the cell. Segments spanning more than MAX_SPAN
+    cells along an axis, or lying beyond CELL_LIMIT cells from the
+    origin, are kept in a per-curve overflow list instead and checked by
+    their bounding boxes; segments with non-finite ends are left out. A
+    curve is re-filed only when its plot has been recomputed.
+    """
+
+    MAX_SPAN = 4
+    CELL_LIMIT = 1 << 30
+
+    def __init__(self):
+        self.cells = defaultdict(dict)
+        self.samples = {}
+        self.versions = {}
+        # Cells each curve is filed under, and its overflow segments as
+        # (indices, lower corners, upper corners).
+        self.filed = {}
+        self.overflow = {}
+
+    def update(self, curve, samples, version):
+        if self.versions.get(curve) == version:
+            return
+        self.remove(curve)
+        self.samples[curve] = samples
+        self.versions[curve] = version
+        if len(samples) < 2:
+            return
+        lo = np.minimum(samples[:-1], samples[1:])
+        hi = np.maximum(samples[:-1], samples[1:])
+        with np.errstate(invalid='ignore', over='ignore'):
+            (clo, chi) = (np.floor(lo / CELL_SIZE), np.floor(hi / CELL_SIZE))
+            finite = np.all(np.isfinite(clo) & np.isfinite(chi), axis=1)
+            small = finite & np.all(
+                (chi - clo < self.MAX_SPAN) &
+                (np.abs(clo) < self.CELL_LIMIT) &
+                (np.abs(chi) < self.CELL_LIMIT), axis=1)
+        big = np.flatnonzero(finite & ~small)
+        if len(big):
+            self.overflow[curve] = (big, lo[big], hi[big])
+        ks = np.flatnonzero(small)
+        if len(ks) == 0:
+            return
+        (clo, chi) = (clo[ks].astype(np.int64), chi[ks].astype(np.int64))
+        # Every segment is filed under the MAX_SPAN x MAX_SPAN cells from
+        # its lower corner that its bounding box reaches.
+        steps = np.arange(self.MAX_SPAN)
+        (dx, dy) = (np.repeat(steps, self.MAX_SPAN),
+                    np.tile(steps, self.MAX_SPAN))
+        cx = clo[:, 0:1] + dx
+        cy = clo[:, 1:2] + dy
+        inside = (cx <= chi[:, 0:1]) & (cy <= chi[:, 1:2])
+        (cx, cy) = (cx[inside], cy[inside])
+        owners = np.broadcast_to(ks[:, np.newaxis], inside.shape)[inside]
+        order = np.lexsort((owners, cy, cx))
+        (cx, cy, owners) = (cx[order], cy[order], owners[order])
+        starts = np.flatnonzero(np.concatenate((
+            [True], (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1]))))
+        filed = []
+        for (cell, segments) in zip(
+                zip(cx[starts].tolist(), cy[starts].tolist()),
+                np.split(owners, starts[1:])):
+            self.cells[cell][curve] = segments.tolist()
+            filed.append(cell)
+        self.filed[curve] = filed
+
+    def remove(self, curve):
+        self.samples.pop(curve, None)
+        self.versions.pop(curve, None)
+        self.overflow.pop(curve, None)
+        for cell in self.filed.pop(curve, ()):
+            segments = self.cells.get(cell)
+            if segments is not None and segments.pop(curve, None) is not None:
+                if not segments:
+                    del self.cells[cell]
+
+    def candidates(self, x, y, scx, scy, radius):
+        """Maps the curves with plot segments in the cells within radius
+        pixels of (x, y) to the indices of those segments."""
+        candidates = defaultdict(set)
+        for cell in cells_around(x, y, scx, scy, radius):
+            for (curve, segments) in self.cells.get(cell, {}).items():
+                candidates[curve].update(segments)
+        (rx, ry) = (radius / scx, radius / scy)
+        for (curve, (ks, lo, hi)) in self.overflow.items():
+            near = ks[(lo[:, 0] <= x + rx) & (hi[:, 0] >= x - rx) &
+                      (lo[:, 1] <= y + ry) & (hi[:, 1] >= y - ry)]
+            if len(near):
+                candidates[curve].update(near.tolist())
+        return candidates
+
+    def nearest(self, x, y, scx, scy, radius):
+        """Curve whose plot passes closest to (x, y) within radius pixels."""
+        candidates = self.candidates(x, y, scx, scy, radius)
+        best = None
+        best_dist = radius
+        scale = np.array([scx, scy])
+        cursor = np.array([[x, y]]) * scale
+        for (curve, segments) in candidates.items():
+            ks = np.fromiter(segments, dtype=int)
+            samples = self.samples[curve]
+            dist = chord_deviation(samples[ks] * scale,
+                                   samples[ks + 1] * scale, cursor).min()
+            if dist < best_dist:
+                (best, best_dist) = (curve, dist)
+        return best
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+def solve_tridiagonal(a, b, c, d):
+    """Solves a tridiagonal system with the Thomas algorithm.
+
+    Input: the sub-diagonal a (a[0] unused), the diagonal b, the
+           super-diagonal c (c[-1] unused) and the right-hand side d,
+           one column per coordinate.
+    Output: the solution as an array shaped like d.
+    O(n) per column.
+    """
+    n = len(b)
+    d = np.asarray(d, dtype=np.float64)
+    result = np.empty_like(d)
+    if n == 0:
+        return result
+    (a, b, c) = (np.asarray(a, dtype=np.float64).tolist(),
+                 np.asarray(b, dtype=np.float64).tolist(),
+                 np.asarray(c, dtype=np.float64).tolist())
+    # The elimination factors depend only on the matrix.
+    cp = [0.0] * n
+    inv = [0.0] * n
+    inv[0] = 1.0 / b[0]
+    cp[0] = c[0] * inv[0]
+    for i in range(1, n):
+        inv[i] = 1.0 / (b[i] - a[i] * cp[i - 1])
+        cp[i] = c[i] * inv[i]
+    for (col, out) in zip(d.reshape(n, -1).T, result.reshape(n, -1).T):
+        dp = col.tolist()
+        dp[0] *= inv[0]
+        for i in range(1, n):
+            dp[i] = (dp[i] - a[i] * dp[i - 1]) * inv[i]
+        for i in range(n - 2, -1, -1):
+            dp[i] -= cp[i] * dp[i + 1]
+        out[:] = dp
+    return result
+
+
+def solve_cyclic_tridiagonal(a, b, c, d):
+    """Solves a tridiagonal system with corner entries.
+
+    Like solve_tridiagonal, but a[0] sits in the top-right corner and
+    c[-1] in the bottom-left one. Uses the Sherman-Morrison formula,
+    which costs two ordinary tridiagonal solves. Needs n >= 3.
+    """
+    n = len(b)
+    (alpha, beta) = (c[-1], a[0])
+    gamma = -b[0]
+    bb = np.array(b, dtype=np.float64)
+    bb[0] -= gamma
+    bb[-1] -= alpha * beta / gamma
+    d = np.asarray(d, dtype=np.float64).reshape(n, -1)
+    u = np.zeros((n, 1))
+    (u[0], u[-1]) = (gamma, alpha)
+    solved = solve_tridiagonal(a, bb, c, np.hstack((d, u)))
+    (x, z) = (solved[:, :-1], solved[:, -1])
+    fact = ((x[0] + beta * x[-1] / gamma) /
+            (1.0 + z[0] + beta * z[-1] / gamma))
+    return x - z[:, np.newaxis] * fact
+
+
+def spline_moments(points, periodic=False):
+    """Second derivatives at the knots of an interpolating cubic spline.
+
+    Knots are spaced uniformly. A natural spline has zero second
+    derivative at both ends, a periodic one closes the curve back to the
+    first point with matching derivatives. O(n) in the number of points.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(pts)
+    if periodic:
+        if n < 3:
+            return np.zeros((n, 2))
+        rhs = 6.0 * (np.roll(pts, -1, axis=0) - 2.0 * pts +
+                     np.roll(pts, 1, axis=0))
+        return solve_cyclic_tridiagonal(np.ones(n), np.full(n, 4.0),
+                                        np.ones(n), rhs)
+    moments = np.zeros((n, 2))
+    if n > 2:
+        rhs = 6.0 * (pts[2:] - 2.0 * pts[1:-1] + pts[:-2])
+        moments[1:-1] = solve_tridiagonal(np.ones(n - 2),
+                                          np.full(n - 2, 4.0),
+                                          np.ones(n - 2), rhs)
+    return moments
+
+
+def evaluate_spline(points, moments, ts, periodic=False):
+    """Evaluates a cubic spline at many parameters in [0, 1] at once."""
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    ts = np.asarray(ts, dtype=np.float64)
+    if periodic and len(pts) >= 3:
+        pts = np.vstack((pts, pts[:1]))
+        moments = np.vstack((moments, moments[:1]))
+    elif periodic and len(pts) == 2:
+        pts = np.vstack((pts, pts[:1]))
+        moments = np.zeros((3, 2))
+    segments = len(pts) - 1
+    if segments < 1:
+        return np.repeat(pts, len(ts), axis=0)
+    s = ts * segments
+    k = np.clip(np.floor(s).astype(int), 0, segments - 1)
+    u = (s - k)[:, np.newaxis]
+    v = 1.0 - u
+    return (v * pts[k] + u * pts[k + 1] +
+            ((v ** 3 - v) * moments[k] +
+             (u ** 3 - u) * moments[k + 1]) / 6.0)
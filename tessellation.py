@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+def tessellate(evaluate, scx, scy, segments=16, tolerance=0.5,
+               max_depth=16, max_samples=None, probes=None):
+    """Samples a parametric curve on [0, 1] adaptively.
+
+    Input: evaluate maps an array of parameters to an (n, 2) array of
+           points, scx and scy scale model coordinates to pixels.
+    Output: the sampled parameters and the (n, 2) array of points.
+    Starts from `segments` uniform pieces and keeps halving every piece
+    whose midpoint lies further than `tolerance` pixels from its chord.
+    Each level evaluates the midpoints of all pending pieces in one call.
+    With max_samples set, once splitting every piece would exceed it,
+    only the pieces deviating most are split and sampling stops.
+    With probes set, the curve is also evaluated at that many uniform
+    pieces up front, and a piece is halved while one of those points
+    strays from its chord: few segments then miss no more detail than
+    starting from probes segments would, without sampling them all.
+    """
+    return tessellate_many(lambda ks, ts: evaluate(ts), 1, scx, scy,
+                           segments, tolerance, max_depth, max_samples,
+                           probes)[0]
+
+
+def tessellate_many(evaluate, count, scx, scy, segments=16, tolerance=0.5,
+                    max_depth=16, max_samples=None, probes=None):
+    """Samples count parametric curves on [0, 1] adaptively, together.
+
+    evaluate maps an array of curve indices and one of parameters to the
+    (n, 2) array of points; every level of halving evaluates the pending
+    pieces of all curves in one call. Returns a (parameters, points)
+    pair per curve; max_samples bounds the samples of all curves and
+    probes applies to each curve.
+    """
+    ts = np.tile(np.linspace(0.0, 1.0, segments + 1), count)
+    ks = np.repeat(np.arange(count), segments + 1)
+    points = evaluate(ks, ts)
+    scale = np.array([scx, scy], dtype=np.float64)
+    probed = None
+    if probes is not None:
+        probe_ts = np.tile(np.linspace(0.0, 1.0, probes + 1), count)
+        probe_ks = np.repeat(np.arange(count), probes + 1)
+        # Curve index and parameter in one sortable key, as parameters
+        # are below 2, and the probes in pixels.
+        probed = (2 * probe_ks + probe_ts,
+                 evaluate(probe_ks, probe_ts) * scale)
+    # A piece joins a sample to the next one of the same curve.
+    pending = np.flatnonzero(ks[:-1] == ks[1:])
+    for _ in range(max_depth):
+        if len(pending) == 0:
+            break
+        mids = 0.5 * (ts[pending] + ts[pending + 1])
+        mid_points = evaluate(ks[pending], mids)
+        deviation = chord_deviation(points[pending] * scale,
+                                    points[pending + 1] * scale,
+                                    mid_points * scale)
+        if probed is not None:
+            (probe_deviation, owner) = _probe_deviation(
+                ks, ts, points, pending, probed, scale)
+            deviation = np.maximum(deviation, probe_deviation)
+        split = deviation > tolerance
+        full = (max_samples is not None and
+                np.count_nonzero(split) > max_samples - len(ts))
+        if full:
+            rough = np.flatnonzero(split)
+            worst = rough[np.argsort(deviation[rough])[::-1]]
+            split[worst[max(max_samples - len(ts), 0):]] = False
+        if probed is not None:
+            # Probes of pieces that are done need no more checks.
+            inside = owner >= 0
+            inside[inside] = split[owner[inside]]
+            probed = tuple(array[inside] for array in probed)
+        pending = pending[split]
+        ts = np.insert(ts, pending + 1, mids[split])
+        ks = np.insert(ks, pending + 1, ks[pending])
+        points = np.insert(points, pending + 1, mid_points[split], axis=0)
+        if full:
+            break
+        # Every split piece is now two pieces, both still pending.
+        first = pending + np.arange(len(pending))
+        pending = np.column_stack((first, first + 1)).ravel()
+    ends = np.cumsum(np.bincount(ks, minlength=count))[:-1]
+    return list(zip(np.split(ts, ends), np.split(points, ends)))
+
+
+def _probe_deviation(ks, ts, points, pending, probed, scale):
+    """The largest distance of a probe inside each pending piece from
+    the piece's chord, in pixels, and the pending piece of every probe,
+    or -1 for a probe inside none."""
+    (probe_keys, probe_pixels) = probed
+    starts = 2 * ks[pending] + ts[pending]
+    ends = 2 * ks[pending + 1] + ts[pending + 1]
+    owner = np.searchsorted(starts, probe_keys, side='right') - 1
+    safe = np.maximum(owner, 0)
+    owner[(owner < 0) | (probe_keys <= starts[safe]) |
+          (probe_keys >= ends[safe])] = -1
+    mask = owner >= 0
+    owners = owner[mask]
+    result = np.zeros(len(pending))
+    if len(owners):
+        # Probes are sorted, so those of a piece are consecutive.
+        first = np.flatnonzero(np.diff(owners, prepend=-1))
+        counts = np.diff(np.append(first, len(owners)))
+        pieces = pending[owners[first]]
+        deviation = chord_deviation(
+            np.repeat(points[pieces] * scale, counts, axis=0),
+            np.repeat(points[pieces + 1] * scale, counts, axis=0),
+            probe_pixels[mask])
+        result[owners[first]] = np.maximum.reduceat(deviation, first)
+    return (result, owner)
+
+
+def chord_deviation(a, b, p):
+    """Distance from every point p to the segment between a and b."""
+    ab = b - a
+    length2 = np.einsum('ij,ij->i', ab, ab)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.einsum('ij,ij->i', p - a, ab) / length2
+    s = np.clip(np.nan_to_num(s), 0.0, 1.0)
+    closest = a + s[:, np.newaxis] * ab
+    return np.hypot(*(p - closest).T)
+
+
+def simplify(points, tolerance):
+    """Simplifies a polyline by the Ramer-Douglas-Peucker algorithm.
+
+    Output: the sorted indices of the points kept; every point dropped
+            lies within tolerance of the simplified polyline.
+    Pieces are split at their furthest point until none strays further
+    than tolerance from its chord; the distances of each piece are
+    computed in one call.
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    pending = [(0, n - 1)]
+    while pending:
+        (i, j) = pending.pop()
+        if j - i < 2:
+            continue
+        inner = points[i + 1:j]
+        deviation = chord_deviation(np.broadcast_to(points[i], inner.shape),
+                                    np.broadcast_to(points[j], inner.shape),
+                                    inner)
+        k = int(np.argmax(deviation))
+        if deviation[k] > tolerance:
+            keep[i + 1 + k] = True
+            pending.extend(((i, i + 1 + k), (i + 1 + k, j)))
+    return np.flatnonzero(keep)
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from bezier_spline import (split_segments, cubic_segments,
+                           tessellate_segments, evaluate_segments,
+                           linked_moves, enforce_continuity,
+                           bezier_to_cubics)
+from curve import Curve
+from tessellation import tessellate
+from utils import (deCasteljauMany, deCasteljauRatMany)
+
+
+TS = np.linspace(0.0, 1.0, 257)
+
+
+def segment_by_segment(points, scx, scy):
+    """Parameters and samples as when every segment was tessellated on
+    its own."""
+    segments = split_segments(points)
+    (params, parts) = ([], [])
+    for (k, segment) in enumerate(segments):
+        (ts, samples) = tessellate(
+            lambda ts, segment=segment: deCasteljauMany(segment, ts),
+            scx, scy, segments=8)
+        params.append((ts[1:] if parts else ts) + k)
+        parts.append(samples[1:] if parts else samples)
+    return (np.concatenate(params) / len(segments), np.concatenate(parts))
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5, 6, 7, 8, 31])
+def test_cubic_segments_trace_the_segments(n):
+    points = np.random.RandomState(n).rand(n, 2)
+    segments = split_segments(points)
+    cubics = cubic_segments(points)
+    assert cubics.shape == (len(segments), 4, 2)
+    for (segment, cubic) in zip(segments, cubics):
+        np.testing.assert_allclose(deCasteljauMany(cubic, TS),
+                                   deCasteljauMany(segment, TS),
+                                   rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('n', [1, 4, 5, 31, 301])
+def test_batched_tessellation_matches_segment_by_segment(n):
+    points = np.random.RandomState(n).rand(n, 2)
+    (ts, samples, _) = tessellate_segments(points, 800, 600, {})
+    (expected_ts, expected) = segment_by_segment(points, 800, 600)
+    np.testing.assert_allclose(ts, expected_ts, rtol=0, atol=1e-15)
+    np.testing.assert_allclose(samples, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(evaluate_segments(points, ts), samples,
+                               rtol=0, atol=1e-12)
+
+
+def test_cache_is_reused_and_left_alone():
+    points = np.random.RandomState(0).rand(31, 2)
+    (_, samples, cache) = tessellate_segments(points, 800, 600, {})
+    before = dict(cache)
+    points[16] += 0.01
+    (_, moved, fresh) = tessellate_segments(points, 800, 600, cache)
+    assert cache == before
+    # Point 16 is a handle of segment 5 only; only that one is new.
+    assert len(set(fresh) - set(cache)) == 1
+    np.testing.assert_allclose(moved, segment_by_segment(points, 800, 600)[1],
+                               rtol=0, atol=1e-12)
+
+
+def test_plot_job_leaves_the_curve_alone():
+    curve = Curve('bzspline')
+    for (x, y) in np.random.RandomState(1).rand(10, 2).tolist():
+        curve.add_point(x, y)
+    job = curve.prepare_plot(800, 600)
+    assert curve.segment_cache == {}
+    plot = job()
+    assert curve.segment_cache == {}
+    curve.set_plot(plot)
+    assert len(curve.segment_cache) == 3
+
+
+def turn(points, joint):
+    into = points[joint] - points[joint - 1]
+    out = points[joint + 1] - points[joint]
+    return into[0] * out[1] - into[1] * out[0], into @ out
+
+
+@pytest.mark.parametrize('continuity', ['g1', 'c1'])
+def test_enforce_continuity_aligns_every_joint(continuity):
+    points = np.random.RandomState(2).rand(13, 2)
+    for (j, position) in enforce_continuity(points, continuity):
+        points[j] = position
+    for joint in (3, 6, 9):
+        (cross, dot) = turn(points, joint)
+        assert abs(cross) < 1e-12 and dot > 0
+        if continuity == 'c1':
+            np.testing.assert_allclose(points[joint + 1] - points[joint],
+                                       points[joint] - points[joint - 1],
+                                       rtol=0, atol=1e-12)
+
+
+def test_moving_a_handle_keeps_its_joint_smooth():
+    points = np.random.RandomState(3).rand(7, 2)
+    for (j, position) in enforce_continuity(points, 'g1'):
+        points[j] = position
+    outgoing = np.hypot(*(points[4] - points[3]))
+    old = tuple(points[2])
+    points[2] += (0.1, -0.2)
+    for (j, position) in linked_moves(points, 2, old, 'g1'):
+        points[j] = position
+    (cross, dot) = turn(points, 3)
+    assert abs(cross) < 1e-12 and dot > 0
+    assert np.hypot(*(points[4] - points[3])) == pytest.approx(outgoing)
+
+
+def test_moving_a_joint_carries_its_handles():
+    points = np.random.RandomState(4).rand(7, 2)
+    old = tuple(points[3])
+    points[3] += (0.25, 0.5)
+    moves = dict(linked_moves(points, 3, old, 'none'))
+    assert sorted(moves) == [2, 4]
+    np.testing.assert_allclose(moves[4] - points[4], (0.25, 0.5))
+
+
+def test_cubics_are_converted_exactly():
+    points = np.random.RandomState(5).rand(3, 2)
+    cubic = bezier_to_cubics(points)
+    np.testing.assert_allclose(deCasteljauMany(cubic, TS),
+                               deCasteljauMany(points, TS),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_high_degrees_are_converted_within_tolerance(weighted):
+    state = np.random.RandomState(6)
+    points = state.rand(9, 2)
+    weights = 0.5 + state.rand(9) if weighted else np.ones(9)
+    cubics = bezier_to_cubics(points, weights if weighted else None, 1e-4)
+    assert len(cubics) % 3 == 1
+    exact = deCasteljauRatMany(points, weights, TS)
+    # Equal pieces of the parameter, so the parameters line up.
+    np.testing.assert_allclose(evaluate_segments(cubics, TS), exact,
+                               rtol=0, atol=1e-4)
+    for (cross, dot) in (turn(cubics, joint)
+                         for joint in range(3, len(cubics) - 1, 3)):
+        assert abs(cross) < 1e-12 and dot > 0
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import curve as curve_module
+from curve import Curve
+
+
+def plotted(ctype, points, scale=(800, 600)):
+    curve = Curve(ctype)
+    for (x, y) in points:
+        curve.add_point(x, y)
+    curve.make_plot(*scale)
+    return curve
+
+
+def dense(curve, samples=200001):
+    ts = np.linspace(0.0, 1.0, samples)
+    return (ts, curve.evaluate(ts))
+
+
+def test_length_of_a_line():
+    curve = plotted('bezier', [(0.1, 0.1), (0.4, 0.5)])
+    assert curve.length() == pytest.approx(0.5)
+    np.testing.assert_allclose(curve.point_at_length(0.25), [[0.25, 0.3]])
+    assert curve.parameter_at(0.25) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize('ctype', ['bezier', 'bzspline', 'nspline',
+                                   'pspline', 'interp'])
+def test_length_matches_dense_sampling(ctype):
+    points = np.random.RandomState(0).rand(7, 2).tolist()
+    curve = plotted(ctype, points)
+    (_, samples) = dense(curve)
+    exact = np.hypot(*np.diff(samples, axis=0).T).sum()
+    # The plot is within half a pixel of the curve.
+    assert curve.length() == pytest.approx(exact, rel=5e-3)
+
+
+@pytest.mark.parametrize('ctype', ['bezier', 'bzspline', 'nspline',
+                                   'pspline'])
+def test_project_finds_the_closest_point(ctype):
+    state = np.random.RandomState(1)
+    curve = plotted(ctype, state.rand(7, 2).tolist())
+    (ts, samples) = dense(curve)
+    for (x, y) in state.rand(20, 2).tolist():
+        (t, point, distance, _) = curve.project(x, y, 800, 600)
+        pixels = np.hypot(*((samples - (x, y)) * (800, 600)).T)
+        assert distance <= pixels.min() + 1e-3
+        np.testing.assert_allclose(point, curve.evaluate(np.array([t]))[0])
+
+
+def test_queries_reuse_the_plot_job(monkeypatch):
+    curve = plotted('nspline', np.random.RandomState(2).rand(50, 2).tolist())
+
+    def solve(*args):
+        raise AssertionError('spline solved again')
+    monkeypatch.setattr(curve_module, 'spline_moments', solve)
+    curve.length()
+    curve.project(0.5, 0.5, 800, 600)
+    curve.point_at_length(0.1)
+
+
+def test_arc_table_follows_the_plot_not_the_edit():
+    curve = plotted('nspline', [(0.1, 0.1), (0.5, 0.9), (0.9, 0.1)])
+    length = curve.length()
+    curve.move_point_to(1, 0.5, 0.5)
+    # Until the next plot, queries describe the curve that is shown.
+    assert curve.length() == length
+    curve.make_plot(800, 600)
+    assert curve.length() < length
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from curve import Curve
+from document import (save_document, LazyCurves, DocumentError)
+
+
+def curves():
+    state = np.random.RandomState(0)
+    plain = Curve.from_arrays('nspline', state.rand(5, 2), np.ones(5),
+                              'plain')
+    plain.is_hull = True
+    weighted = Curve.from_arrays('rbezier', state.rand(4, 2),
+                                 0.5 + state.rand(4), 'wéighted')
+    weighted.is_guide = True
+    spline = Curve.from_arrays('bzspline', state.rand(7, 2), np.ones(7),
+                               'spline')
+    spline.continuity = 'c1'
+    empty = Curve('bezier')
+    return {'plain': plain, 'wéighted': weighted, 'spline': spline,
+            'empty': empty}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'doc.crv')
+    saved = curves()
+    save_document(path, saved, 'spline')
+    loaded = LazyCurves(path)
+    assert list(loaded) == list(saved)
+    assert loaded.active == 'spline'
+    assert loaded.ctype('wéighted') == 'rbezier'
+    assert not loaded.is_decoded('wéighted')
+    for (name, curve) in saved.items():
+        copy = loaded[name]
+        assert copy.ctype == curve.ctype
+        np.testing.assert_array_equal(copy.points, curve.points)
+        np.testing.assert_array_equal(copy.weights, curve.weights)
+        assert (copy.is_hull, copy.is_guide, copy.continuity) == (
+            curve.is_hull, curve.is_guide, curve.continuity)
+    # Every curve is decoded, so the map is closed.
+    assert loaded.map is None
+
+
+def test_bounds_without_decoding(tmp_path):
+    path = str(tmp_path / 'doc.crv')
+    saved = curves()
+    save_document(path, saved)
+    loaded = LazyCurves(path)
+    points = saved['plain'].points
+    assert loaded.bounds('plain') == pytest.approx(
+        tuple(points.min(axis=0)) + tuple(points.max(axis=0)))
+    assert not loaded.is_decoded('plain')
+    assert loaded.active is None
+    loaded.close()
+
+
+def test_edits_keep_the_order(tmp_path):
+    path = str(tmp_path / 'doc.crv')
+    save_document(path, curves())
+    loaded = LazyCurves(path)
+    del loaded['plain']
+    loaded['new'] = Curve('bezier')
+    assert list(loaded) == ['wéighted', 'spline', 'empty', 'new']
+    with pytest.raises(KeyError):
+        loaded['plain']
+    loaded.close()
+    assert len(loaded['spline'].points) == 7
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: b'',
+    lambda data: b'NOPE' + data[4:],
+    lambda data: data[:4] + b'\x02\x00' + data[6:],
+    lambda data: data[:20],
+    lambda data: data[:len(data) - 8],
+    lambda data: data[:8] + b'\xff\xff' + data[10:],
+])
+def test_damaged_documents_are_refused(tmp_path, damage):
+    path = str(tmp_path / 'doc.crv')
+    save_document(path, curves())
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(damage(data))
+    with pytest.raises(DocumentError):
+        LazyCurves(path)
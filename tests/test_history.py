@@ -0,0 +1,70 @@
+import numpy as np
+
+from history import (History, op_size)
+
+
+def test_undo_and_redo_replay_the_recorded_ops():
+    history = History()
+    history.push([['add_point', 'c', 0.1, 0.2]], [['remove_point', 'c', 0]])
+    history.push([['add_point', 'c', 0.3, 0.4]], [['remove_point', 'c', 1]])
+    assert history.undo() == [['remove_point', 'c', 1]]
+    assert history.redo() == [['add_point', 'c', 0.3, 0.4]]
+    assert history.redo() is None
+    history.undo()
+    history.push([['select', 'c']], [])
+    # A new edit drops what could have been redone.
+    assert not history.can_redo()
+
+
+def test_a_group_is_one_entry_merging_edits_by_key():
+    history = History()
+    history.begin_group()
+    history.push([['move', 'c', 0, 0.1, 0.1]], [['move', 'c', 0, 0.0, 0.0]],
+                 key=('move', 'c', 0))
+    history.begin_group()
+    history.push([['move', 'c', 1, 0.5, 0.5]], [['move', 'c', 1, 0.2, 0.2]])
+    history.end_group()
+    history.push([['move', 'c', 0, 0.3, 0.3]], [['move', 'c', 0, 0.1, 0.1]],
+                 key=('move', 'c', 0))
+    history.end_group()
+    assert len(history.undo_stack) == 1
+    # Undone in reverse, the merged move back to where it started.
+    assert history.undo() == [['move', 'c', 1, 0.2, 0.2],
+                              ['move', 'c', 0, 0.0, 0.0]]
+    assert history.redo() == [['move', 'c', 0, 0.3, 0.3],
+                              ['move', 'c', 1, 0.5, 0.5]]
+
+
+def test_empty_groups_leave_nothing_to_undo():
+    history = History()
+    history.begin_group()
+    assert not history.can_undo()
+    history.end_group()
+    assert len(history.undo_stack) == 0
+    history.begin_group()
+    assert history.undo() is None
+    assert history.group is None and history.depth == 0
+
+
+def test_oldest_entries_are_dropped_past_the_limit():
+    points = np.zeros((1000, 2))
+    size = op_size([['restore', 'c', points]])
+    history = History(limit=3 * size)
+    for k in range(10):
+        history.push([['restore', 'c', points]], [['select', str(k)]])
+    assert len(history.undo_stack) < 4
+    assert history.size <= history.limit
+    assert history.undo() == [['select', '9']]
+
+
+def test_the_open_group_is_kept_however_large():
+    points = np.zeros((1000, 2))
+    history = History(limit=100)
+    history.push([['select', 'c']], [])
+    history.begin_group()
+    for _ in range(3):
+        history.push([['restore', 'c', points]], [['remove', 'c']])
+    assert len(history.undo_stack) == 1
+    assert history.size > history.limit
+    history.end_group()
+    assert len(history.undo()) == 3
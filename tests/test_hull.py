@@ -0,0 +1,57 @@
+import numpy as np
+
+from hull import DynamicHull
+from utils import convex_hull
+
+
+def full_hull(points):
+    return [i for (_, _, i) in convex_hull(
+        (x, y, i) for (i, (x, y)) in enumerate(points))]
+
+
+def same_cycle(a, b):
+    if len(a) != len(b):
+        return False
+    if not a:
+        return True
+    k = b.index(a[0]) if a[0] in b else -1
+    return k >= 0 and b[k:] + b[:k] == a
+
+
+def test_adding_points_matches_full_rebuild():
+    state = np.random.RandomState(0)
+    points = []
+    hull = None
+    for _ in range(300):
+        points.append(tuple(state.rand(2)))
+        if hull is None:
+            hull = DynamicHull(points)
+        else:
+            hull.add(points, len(points) - 1)
+        assert same_cycle(hull.vertices, full_hull(points))
+
+
+def test_moving_points_matches_full_rebuild():
+    state = np.random.RandomState(1)
+    points = [tuple(p) for p in state.rand(200, 2).tolist()]
+    hull = DynamicHull(points)
+    for _ in range(2000):
+        i = state.randint(len(points))
+        old = points[i]
+        # Mostly small drags, sometimes far jumps in or out.
+        step = 0.05 if state.rand() < 0.8 else 1.0
+        points[i] = tuple(np.array(old) + step * state.randn(2))
+        hull.move(points, i, old)
+        assert same_cycle(hull.vertices, full_hull(points))
+        assert hull.members == set(hull.vertices)
+
+
+def test_moving_an_interior_point_does_not_rebuild():
+    points = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.5, 0.5)]
+    hull = DynamicHull(points)
+    rebuilds = hull.rebuilds
+    old = points[4]
+    points[4] = (0.4, 0.6)
+    hull.move(points, 4, old)
+    assert hull.rebuilds == rebuilds
+    assert same_cycle(hull.vertices, full_hull(points))
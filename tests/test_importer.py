@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from bezier_spline import (fit_cubics, evaluate_segments)
+from importer import (import_curves, CellFilter, PointCloudError,
+                      path_points)
+from tessellation import (simplify, chord_deviation)
+
+RECT = (0.1, 0.1, 0.9, 0.9)
+
+
+def distances(points, curve, samples=20001):
+    """Distance of every point to the closest of dense samples of a
+    Bézier spline."""
+    dense = evaluate_segments(curve, np.linspace(0.0, 1.0, samples))
+    return np.array([np.hypot(*(dense - p).T).min() for p in points])
+
+
+def noisy_circle(n=500, noise=1e-3, seed=0):
+    angles = np.linspace(0.0, 1.5 * np.pi, n)
+    points = np.column_stack((np.cos(angles), np.sin(angles)))
+    return points + noise * np.random.RandomState(seed).randn(n, 2)
+
+
+@pytest.mark.parametrize('tolerance', [1e-2, 1e-3])
+def test_fit_cubics_stays_within_tolerance(tolerance):
+    points = noisy_circle(noise=tolerance / 4)
+    curve = fit_cubics(points, tolerance)
+    assert len(curve) % 3 == 1
+    np.testing.assert_array_equal(curve[[0, -1]], points[[0, -1]])
+    # Dense samples stand in for the curve, so allow for their spacing.
+    assert distances(points, curve).max() <= 1.01 * tolerance + 1e-4
+    assert len(curve) < len(points) / 4
+
+
+def test_fit_cubics_keeps_corners():
+    side = np.linspace(0.0, 1.0, 50)
+    points = np.concatenate((np.column_stack((side, np.zeros(50))),
+                             np.column_stack((np.ones(49), side[1:]))))
+    curve = fit_cubics(points, 1e-3, corners=[49])
+    assert any(np.array_equal(p, [1.0, 0.0]) for p in curve[::3])
+    assert distances(points, curve).max() <= 1.1e-3
+
+
+def test_simplify_stays_within_tolerance():
+    points = noisy_circle(noise=1e-2)
+    kept = simplify(points, 0.02)
+    assert kept[0] == 0 and kept[-1] == len(points) - 1
+    assert len(kept) < len(points) / 4
+    for (i, j) in zip(kept[:-1], kept[1:]):
+        inner = points[i + 1:j]
+        deviation = chord_deviation(np.broadcast_to(points[i], inner.shape),
+                                    np.broadcast_to(points[j], inner.shape),
+                                    inner)
+        assert np.all(deviation <= 0.02)
+
+
+def test_cell_filter_thins_chunks_like_the_whole():
+    points = noisy_circle(n=5000, noise=0.0)
+    cells = CellFilter(0.01)
+    for chunk in np.array_split(points, 7):
+        cells.feed(0, chunk)
+    (kept,) = cells.strokes()
+    assert len(kept) < len(points) / 4
+    np.testing.assert_array_equal(kept[[0, -1]], points[[0, -1]])
+    # Every point dropped lies within a cell diagonal of a kept one.
+    diagonal = 0.01 * (points.max(axis=0) - points.min(axis=0)).max()
+    nearest = np.array([np.hypot(*(kept - p).T).min() for p in points])
+    assert nearest.max() <= diagonal
+
+
+def test_csv_import(tmp_path):
+    path = tmp_path / 'points.csv'
+    rows = '\n'.join('{},{}'.format(x, y) for (x, y) in noisy_circle())
+    path.write_text('x,y\n' + rows + '\n')
+    (curve,) = import_curves(str(path), RECT, 1e-3, chunk_size=64)
+    assert curve.ctype == 'bzspline'
+    points = curve.points
+    assert np.all(points.min(axis=0) >= 0.1 - 1e-3)
+    assert np.all(points.max(axis=0) <= 0.9 + 1e-3)
+
+
+def test_svg_import(tmp_path):
+    path = tmp_path / 'paths.svg'
+    path.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg">'
+        '<path d="M 0 0 L 10 0 L 10 10 M 20 20 C 25 30 35 30 40 20"/>'
+        '</svg>')
+    curves = import_curves(str(path), RECT, 1e-3)
+    assert len(curves) == 2
+    # The first stroke turns at a right angle, so it keeps the corner.
+    assert curves[0].continuity == 'none'
+
+
+def test_path_points_flattens_relative_commands():
+    (points,) = path_points('m 1 1 h 2 v 2 q 1 1 2 0 z')
+    np.testing.assert_allclose(points[:3], [[1, 1], [3, 1], [3, 3]])
+    np.testing.assert_allclose(points[-2:], [[5, 3], [1, 1]])
+
+
+@pytest.mark.parametrize('content', ['', 'x,y\n', 'x,y\n1,2\n3,oops\n'])
+def test_unusable_files_are_refused(tmp_path, content):
+    path = tmp_path / 'points.csv'
+    path.write_text(content)
+    with pytest.raises(PointCloudError):
+        import_curves(str(path), RECT, 1e-3)
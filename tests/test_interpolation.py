@@ -0,0 +1,68 @@
+import numpy as np
+
+from interpolation import BarycentricInterpolator
+from utils import interpolate
+
+
+def newton(nodes, ys, xs):
+    """The divided-difference interpolation utils.interpolate used to do."""
+    coefficients = list(ys)
+    n = len(nodes)
+    for j in range(1, n):
+        for i in range(n - 1, j - 1, -1):
+            coefficients[i] = ((coefficients[i] - coefficients[i - 1]) /
+                               (nodes[i] - nodes[i - j]))
+    result = []
+    for x in xs:
+        value = coefficients[-1]
+        for i in range(n - 2, -1, -1):
+            value = value * (x - nodes[i]) + coefficients[i]
+        result.append(value)
+    return result
+
+
+XS = np.linspace(0.0, 1.0, 1001)
+
+
+def test_matches_newton_form():
+    ys = np.random.RandomState(0).rand(12)
+    nodes = np.arange(12) / 11.0
+    np.testing.assert_allclose(
+        BarycentricInterpolator(nodes).evaluate(ys, XS),
+        newton(nodes.tolist(), ys.tolist(), XS.tolist()),
+        rtol=0, atol=1e-9)
+
+
+def test_interpolate_leaves_its_input_alone():
+    ys = [0.0, 1.0, 0.5, 2.0]
+    interpolate(1.0 / 3, ys, XS)
+    assert ys == [0.0, 1.0, 0.5, 2.0]
+
+
+def test_nodes_take_their_values():
+    values = np.random.RandomState(1).rand(30, 2)
+    interpolator = BarycentricInterpolator(np.arange(30))
+    np.testing.assert_array_equal(
+        interpolator.evaluate(values, np.arange(30)), values)
+
+
+def test_adding_and_removing_nodes_matches_building_afresh():
+    values = np.random.RandomState(2).rand(40, 2)
+    xs = np.linspace(0.0, 39.0, 333)
+    grown = BarycentricInterpolator()
+    for x in range(40):
+        grown.add_node(x)
+    for _ in range(15):
+        grown.remove_node()
+    np.testing.assert_allclose(
+        grown.evaluate(values[:25], xs * 24 / 39),
+        BarycentricInterpolator(np.arange(25)).evaluate(values[:25],
+                                                        xs * 24 / 39),
+        rtol=1e-9, atol=1e-9)
+
+
+def test_weights_stay_finite_for_many_nodes():
+    interpolator = BarycentricInterpolator(np.arange(2000))
+    assert np.all(np.isfinite(interpolator.weights))
+    assert np.isfinite(interpolator.evaluate(np.ones(2000), [0.5, 1000.5])
+                       ).all()
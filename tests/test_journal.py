@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from curve import Curve
+from document import save_document
+from journal import (EditJournal, orphaned_journals)
+
+
+def journal_in(tmp_path, name='a.journal'):
+    return EditJournal(str(tmp_path / name))
+
+
+def document(tmp_path, name='doc.crv'):
+    curve = Curve('bezier')
+    for (x, y) in [(0.1, 0.2), (0.5, 0.9), (0.8, 0.3)]:
+        curve.add_point(x, y)
+    path = str(tmp_path / name)
+    save_document(path, {'c': curve}, 'c')
+    return path
+
+
+def test_replays_edits_after_a_new_base(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.reset()
+    journal.record('add_curve', 'c', 'bezier')
+    journal.record('add_point', 'c', 0.1, 0.2)
+    journal.record('add_point', 'c', 0.3, 0.4)
+    journal.record('move', 'c', 1, 0.5, 0.6)
+    journal.record('add_curve', 'd', 'nspline')
+    journal.record('select', 'c')
+    journal.flush()
+    assert journal.has_unsaved()
+    (curves, active, error) = journal.recover()
+    assert error is None
+    assert (sorted(curves), active) == (['c', 'd'], 'c')
+    np.testing.assert_array_equal(curves['c'].points,
+                                  [[0.1, 0.2], [0.5, 0.6]])
+
+
+def test_base_is_a_copy_of_the_document(tmp_path):
+    path = document(tmp_path)
+    journal = journal_in(tmp_path)
+    journal.reset(path)
+    journal.record('remove_point', 'c', 2)
+    journal.flush()
+    os.remove(path)
+    (curves, active, error) = journal.recover()
+    assert (error, active) == (None, 'c')
+    np.testing.assert_array_equal(curves['c'].points,
+                                  [[0.1, 0.2], [0.5, 0.9]])
+
+
+def test_replay_stops_at_the_first_failing_op(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.reset(document(tmp_path))
+    journal.record('add_point', 'c', 0.9, 0.9)
+    journal.record('remove_point', 'c', 5)
+    journal.record('add_point', 'c', 0.0, 0.0)
+    journal.flush()
+    (curves, active, error) = journal.recover()
+    assert error.startswith('remove_point')
+    assert len(curves['c'].points) == 4
+
+
+def test_missing_base_recovers_nothing(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.reset(document(tmp_path))
+    journal.record('add_point', 'c', 0.9, 0.9)
+    journal.flush()
+    os.remove(journal.base())
+    (curves, active, error) = journal.recover()
+    assert (curves, active) == ({}, None)
+    assert error.startswith('load')
+
+
+def test_cut_off_batch_ends_the_replay(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.reset()
+    journal.record('add_curve', 'c', 'bezier')
+    journal.flush()
+    with open(journal.path, 'a') as f:
+        f.write('["add_point", "c", 0.')
+    (curves, _, error) = journal.recover()
+    assert error is None
+    assert len(curves['c'].points) == 0
+
+
+def test_compaction_alternates_bases(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.reset()
+    curves = {'c': Curve('bezier')}
+    curves['c'].add_point(0.5, 0.5)
+    journal.compact(curves, 'c')
+    first = journal.base()
+    curves['c'].add_point(0.7, 0.7)
+    journal.compact(curves, 'c')
+    journal.flush()
+    assert journal.base() != first
+    assert not os.path.exists(first)
+    (recovered, active, error) = journal.recover()
+    assert (error, active) == (None, 'c')
+    assert len(recovered['c'].points) == 2
+    journal.discard()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_only_journals_of_gone_processes_are_orphans(tmp_path):
+    mine = journal_in(tmp_path, 'mine.journal')
+    assert mine.acquire()
+    mine.reset()
+    assert not journal_in(tmp_path, 'mine.journal').acquire()
+    # A process that dies without unlocking leaves its lock behind.
+    subprocess.check_call([sys.executable, '-c', '''
+import os, sys
+sys.path.insert(0, {!r})
+from journal import EditJournal
+journal = EditJournal({!r})
+journal.acquire()
+journal.reset()
+os._exit(0)
+'''.format(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+           str(tmp_path / 'gone.journal'))])
+    orphans = orphaned_journals(str(tmp_path))
+    assert [journal.path for journal in orphans] == [
+        str(tmp_path / 'gone.journal')]
+    for journal in orphans:
+        journal.discard()
+    mine.discard()
@@ -0,0 +1,79 @@
+import numpy as np
+
+from spatial_index import (PointGrid, SegmentGrid)
+from tessellation import chord_deviation
+
+SCALE = (800.0, 600.0)
+RADIUS = 8
+
+
+def within(samples, x, y, radius=RADIUS):
+    """Indices of the segments passing within radius pixels of (x, y),
+    found by checking them all."""
+    scale = np.array(SCALE)
+    with np.errstate(invalid='ignore', over='ignore'):
+        dist = chord_deviation(samples[:-1] * scale, samples[1:] * scale,
+                               np.array([[x, y]]) * scale)
+    return set(np.flatnonzero(dist < radius).tolist())
+
+
+def test_point_grid_finds_the_nearest_point():
+    state = np.random.RandomState(0)
+    points = state.rand(300, 2)
+    grid = PointGrid()
+    for (i, point) in enumerate(points):
+        grid.insert(i, point)
+    moved = points[7].copy()
+    points[7] = (0.5, 0.5)
+    grid.move(7, moved, points[7])
+    grid.remove(8, points[8])
+    for (x, y) in state.rand(200, 2):
+        dist = np.hypot(*((points - (x, y)) * SCALE).T)
+        dist[8] = np.inf
+        expected = int(np.argmin(dist)) if dist.min() < RADIUS else None
+        assert grid.nearest(points, x, y, *SCALE, RADIUS) == expected
+
+
+def test_candidates_cover_every_close_segment():
+    state = np.random.RandomState(1)
+    # Short steps mostly, with some long jumps across many cells.
+    steps = 0.005 * state.randn(2000, 2)
+    steps[::97] *= 40
+    samples = np.cumsum(steps, axis=0) % 1.0
+    grid = SegmentGrid()
+    grid.update('curve', samples, 1)
+    assert 'curve' in grid.overflow
+    for (x, y) in state.rand(300, 2):
+        close = within(samples, x, y)
+        found = grid.candidates(x, y, *SCALE, RADIUS).get('curve', set())
+        assert close <= found
+
+
+def test_far_and_non_finite_segments():
+    samples = np.array([[0.2, 0.2], [0.3, 0.2], [1e12, 0.2], [0.5, 0.5],
+                        [np.nan, 0.5], [0.6, 0.6], [np.inf, 0.6],
+                        [0.7, 0.7], [0.8, 0.7]])
+    grid = SegmentGrid()
+    grid.update('curve', samples, 1)
+    for (x, y) in [(0.25, 0.2), (5.0, 0.2), (0.75, 0.7), (0.55, 0.55)]:
+        close = within(samples, x, y)
+        found = grid.candidates(x, y, *SCALE, RADIUS).get('curve', set())
+        assert close <= found
+        assert not found & {3, 4, 5, 6}
+    assert grid.nearest(0.25, 0.2, *SCALE, RADIUS) == 'curve'
+    assert grid.nearest(0.55, 0.55, *SCALE, RADIUS) is None
+
+
+def test_refiling_follows_the_version():
+    first = np.array([[0.1, 0.1], [0.2, 0.1]])
+    second = np.array([[0.6, 0.6], [0.7, 0.6]])
+    grid = SegmentGrid()
+    grid.update('a', first, 1)
+    grid.update('b', second, 1)
+    grid.update('a', second, 1)
+    assert grid.nearest(0.15, 0.1, *SCALE, RADIUS) == 'a'
+    grid.update('a', second + 0.1, 2)
+    assert grid.nearest(0.15, 0.1, *SCALE, RADIUS) is None
+    grid.remove('a')
+    grid.remove('b')
+    assert not grid.cells and not grid.filed
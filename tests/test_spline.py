@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from curve import Curve
+from spline import (solve_tridiagonal, solve_cyclic_tridiagonal,
+                    spline_moments, evaluate_spline)
+from tessellation import chord_deviation
+
+
+def dense(a, b, c, cyclic=False):
+    m = np.diag(b) + np.diag(a[1:], -1) + np.diag(c[:-1], 1)
+    if cyclic:
+        (m[0, -1], m[-1, 0]) = (a[0], c[-1])
+    return m
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 50])
+def test_solve_tridiagonal_matches_dense_solve(n):
+    state = np.random.RandomState(n)
+    (a, c) = (state.rand(n), state.rand(n))
+    b = 3.0 + state.rand(n)
+    d = state.rand(n, 2)
+    np.testing.assert_allclose(solve_tridiagonal(a, b, c, d),
+                               np.linalg.solve(dense(a, b, c), d),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('n', [3, 4, 50])
+def test_solve_cyclic_tridiagonal_matches_dense_solve(n):
+    state = np.random.RandomState(n)
+    (a, c) = (state.rand(n), state.rand(n))
+    b = 3.0 + state.rand(n)
+    d = state.rand(n, 2)
+    np.testing.assert_allclose(solve_cyclic_tridiagonal(a, b, c, d),
+                               np.linalg.solve(dense(a, b, c, True), d),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('periodic', [False, True])
+def test_spline_passes_through_its_points(periodic):
+    points = np.random.RandomState(2).rand(12, 2)
+    moments = spline_moments(points, periodic)
+    segments = len(points) if periodic else len(points) - 1
+    ts = np.arange(len(points)) / segments
+    np.testing.assert_allclose(
+        evaluate_spline(points, moments, ts, periodic), points,
+        rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('periodic', [False, True])
+def test_spline_is_c1_at_the_knots(periodic):
+    points = np.random.RandomState(3).rand(9, 2)
+    moments = spline_moments(points, periodic)
+    segments = len(points) if periodic else len(points) - 1
+    h = 1e-7
+    knots = np.arange(1, len(points) - 1) / segments
+    (left, mid, right) = (evaluate_spline(points, moments, ts, periodic)
+                          for ts in (knots - h, knots, knots + h))
+    np.testing.assert_allclose(mid - left, right - mid, rtol=0, atol=1e-9)
+
+
+def test_natural_spline_has_zero_end_moments():
+    moments = spline_moments(np.random.RandomState(4).rand(7, 2))
+    assert np.all(moments[[0, -1]] == 0.0)
+
+
+@pytest.mark.parametrize('ctype', ['nspline', 'pspline'])
+def test_plot_follows_the_screen_not_the_points(ctype):
+    periodic = ctype == 'pspline'
+    sizes = []
+    for n in (100, 10000, 100000):
+        xs = np.linspace(0.05, 0.95, n)
+        curve = Curve(ctype)
+        for (x, y) in zip(xs.tolist(), (0.5 + 0.3 * np.sin(6 * xs)).tolist()):
+            curve.add_point(x, y)
+        curve.make_plot(1024, 1024)
+        sizes.append(len(curve.samples))
+        ts = np.linspace(0.0, 1.0, 1000001)
+        exact = evaluate_spline(curve.points, spline_moments(
+            curve.points, periodic), ts, periodic) * 1024
+        k = np.clip(np.searchsorted(curve.params, ts, side='right') - 1,
+                    0, len(curve.params) - 2)
+        plot = curve.samples * 1024
+        # No worse than starting from two pieces per point, which leaves
+        # the loop a periodic spline makes at its ends a few pixels out.
+        assert chord_deviation(plot[k], plot[k + 1], exact).max() < 8.0
+    assert max(sizes) < 1000
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from tessellation import (tessellate, tessellate_many, chord_deviation)
+from utils import deCasteljauMany
+
+SCALE = (800.0, 600.0)
+
+
+def bezier(seed, n=6):
+    points = np.random.RandomState(seed).rand(n, 2)
+    return lambda ts: deCasteljauMany(points, ts)
+
+
+def worst_deviation(evaluate, ts, samples, between=16):
+    """Largest distance in pixels of the curve between samples from the
+    chords joining them."""
+    fractions = np.linspace(0.0, 1.0, between + 2)[1:-1]
+    inner = (ts[:-1, np.newaxis] +
+             np.diff(ts)[:, np.newaxis] * fractions).ravel()
+    scale = np.array(SCALE)
+    return chord_deviation(
+        np.repeat(samples[:-1], between, axis=0) * scale,
+        np.repeat(samples[1:], between, axis=0) * scale,
+        evaluate(inner) * scale).max()
+
+
+def test_chord_deviation():
+    a = np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 1.0]])
+    b = np.array([[2.0, 0.0], [2.0, 0.0], [1.0, 1.0]])
+    p = np.array([[1.0, 3.0], [-3.0, 4.0], [4.0, 5.0]])
+    np.testing.assert_allclose(chord_deviation(a, b, p), [3.0, 5.0, 5.0])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_samples_stay_within_tolerance(seed):
+    evaluate = bezier(seed)
+    (ts, samples) = tessellate(evaluate, *SCALE)
+    assert ts[0] == 0.0 and ts[-1] == 1.0
+    assert np.all(np.diff(ts) > 0)
+    np.testing.assert_array_equal(samples, evaluate(ts))
+    # Only midpoints are checked against the tolerance, so points off
+    # the middle of a piece may stray a little further.
+    assert worst_deviation(evaluate, ts, samples) <= 1.0
+
+
+def test_many_curves_are_sampled_as_each_alone():
+    curves = [bezier(seed, n) for (seed, n) in enumerate([2, 4, 6, 9])]
+
+    def evaluate(ks, ts):
+        points = np.empty((len(ts), 2))
+        for (k, curve) in enumerate(curves):
+            points[ks == k] = curve(ts[ks == k])
+        return points
+    together = tessellate_many(evaluate, len(curves), *SCALE)
+    for (curve, (ts, samples)) in zip(curves, together):
+        (alone_ts, alone) = tessellate(curve, *SCALE)
+        np.testing.assert_array_equal(ts, alone_ts)
+        np.testing.assert_array_equal(samples, alone)
+
+
+def test_max_samples_keeps_the_worst_pieces():
+    evaluate = bezier(5, 12)
+    (full_ts, _) = tessellate(evaluate, *SCALE, tolerance=0.01)
+    (ts, samples) = tessellate(evaluate, *SCALE, tolerance=0.01,
+                               max_samples=100)
+    assert len(ts) <= 100 < len(full_ts)
+    assert len(tessellate(evaluate, *SCALE, max_samples=5)[0]) == 17
+
+
+def test_probes_catch_detail_the_seeds_miss():
+    # A narrow bump the four seed pieces step over.
+    def evaluate(ts):
+        return np.column_stack((ts, 0.2 * np.exp(-((ts - 0.6) / 0.01) ** 2)))
+    (ts, _) = tessellate(evaluate, *SCALE, segments=4)
+    assert len(ts) == 5
+    (ts, samples) = tessellate(evaluate, *SCALE, segments=4, probes=128)
+    assert worst_deviation(evaluate, ts, samples) <= 1.0
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from utils import (deCasteljau, deCasteljauRat, deCasteljauMany,
+                   deCasteljauRatMany, bernstein_matrix)
+
+
+TS = np.linspace(0.0, 1.0, 101)
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 10, 40])
+def test_deCasteljauMany_matches_deCasteljau(n):
+    points = np.random.RandomState(n).rand(n, 2)
+    expected = [deCasteljau([tuple(p) for p in points.tolist()], t)
+                for t in TS.tolist()]
+    np.testing.assert_allclose(deCasteljauMany(points, TS), expected,
+                               rtol=0, atol=1e-13)
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 10, 40])
+def test_deCasteljauRatMany_matches_deCasteljauRat(n):
+    state = np.random.RandomState(n)
+    points = state.rand(n, 2)
+    weights = 0.25 + 2 * state.rand(n)
+    expected = [deCasteljauRat([tuple(p) for p in points.tolist()],
+                               weights.tolist(), t) for t in TS.tolist()]
+    np.testing.assert_allclose(deCasteljauRatMany(points, weights, TS),
+                               expected, rtol=0, atol=1e-13)
+
+
+def test_deCasteljauRat_leaves_weights_alone():
+    weights = [1.0, 2.0, 0.5]
+    deCasteljauRat([(0, 0), (1, 1), (2, 0)], weights, 0.3)
+    assert weights == [1.0, 2.0, 0.5]
+
+
+def test_bernstein_matrix_is_a_partition_of_unity():
+    for degree in (0, 1, 5, 200):
+        np.testing.assert_allclose(bernstein_matrix(degree, TS).sum(axis=1),
+                                   1.0, rtol=1e-12)
@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
+
+# Work arrays of the vectorised kernels are cut to about this many
+# elements; interpolation.py shares it.
+_BLOCK_SIZE = 1 << 18
+
 
 def L2Dist(x1, y1, x2, y2):
     return ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
@@ -52,17 +58,105 @@ def deCasteljau(points, t):
 
 
 def deCasteljauRat(points, weights, t):
-    cpPoints = [points[i] for i in range(len(points))]
+    """Evaluates a rational Bézier curve at t.
+
+    Runs de Casteljau's algorithm on the homogeneous points (wx, wy, w)
+    and projects the result; the weights passed in are left untouched.
+    """
+    cpPoints = [(w * x, w * y, w) for ((x, y), w) in zip(points, weights)]
     t1 = 1.0 - t
-    for k in range(1, len(cpPoints) + 1):
+    for k in range(1, len(cpPoints)):
         for i in range(len(cpPoints) - k):
-            u = t1 * weights[i]
-            v = t * weights[i + 1]
-            weights[i] = u + v
-            u = u / weights[i]
-            v = 1 - u
-            cpPoints[i] = combine_pairs([u, v], [cpPoints[i], cpPoints[i + 1]])
-    return cpPoints[0]
+            (a, b) = (cpPoints[i], cpPoints[i + 1])
+            cpPoints[i] = (t1 * a[0] + t * b[0], t1 * a[1] + t * b[1],
+                           t1 * a[2] + t * b[2])
+    (wx, wy, w) = cpPoints[0]
+    return (wx / w, wy / w)
+
+
+def bernstein_matrix(degree, ts):
+    """Computes the Bernstein basis of the given degree at many parameters.
+
+    Output: a (len(ts), degree + 1) array whose row i holds
+            B_{k,degree}(ts[i]) for k = 0..degree.
+    The basis is evaluated in log space, so it neither overflows
+    nor underflows prematurely for high degrees.
+    """
+    ts = np.asarray(ts, dtype=np.float64)[:, np.newaxis]
+    k = np.arange(degree + 1, dtype=np.float64)
+    log_fact = np.concatenate(([0.0], np.cumsum(np.log(k[1:]))))
+    log_binom = log_fact[degree] - log_fact - log_fact[::-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_t = np.where(k > 0, k * np.log(ts), 0.0)
+        log_t1 = np.where(k < degree, (degree - k) * np.log1p(-ts), 0.0)
+    return np.exp(log_binom + log_t + log_t1)
+
+
+def deCasteljauMany(points, ts):
+    """Evaluates a Bézier curve at many parameter values at once.
+
+    Input: the control points as a sequence of (x, y) pairs and a
+           sequence of parameter values.
+    Output: an (len(ts), 2) array of curve points, equal to calling
+            deCasteljau for every value in ts.
+    Evaluated as a Bernstein-matrix product, O(n) per sample.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return deCasteljauRatMany(pts, np.ones(len(pts)), ts)
+
+
+def deCasteljauRatMany(points, weights, ts):
+    """Evaluates a rational Bézier curve at many parameter values at once.
+
+    Same as deCasteljauRat applied to every value in ts, without
+    modifying the weights passed in.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    ws = np.asarray(weights, dtype=np.float64)
+    result = np.empty((len(ts), 2))
+    if len(pts) == 0:
+        return result[:0]
+    homogeneous = np.column_stack((pts * ws[:, np.newaxis], ws))
+    # Bound the size of the basis matrix held in memory at once.
+    chunk = max(1, _BLOCK_SIZE // len(pts))
+    for start in range(0, len(ts), chunk):
+        basis = bernstein_matrix(len(pts) - 1, ts[start:start + chunk])
+        combined = basis @ homogeneous
+        result[start:start + chunk] = combined[:, :2] / combined[:, 2:]
+    return result
+
+
+def subdivide(points, t=0.5):
+    """Splits a Bézier curve in two at parameter t.
+
+    Input: an (n, d) array of control points; for a rational curve pass
+           the homogeneous points (wx, wy, w).
+    Output: the control points of the pieces over [0, t] and [t, 1],
+            read off the sides of de Casteljau's triangle.
+    """
+    pts = np.array(points, dtype=np.float64)
+    n = len(pts)
+    left = np.empty_like(pts)
+    right = np.empty_like(pts)
+    for k in range(n):
+        left[k] = pts[0]
+        right[n - 1 - k] = pts[n - 1 - k]
+        pts[:n - 1 - k] = (1.0 - t) * pts[:n - 1 - k] + t * pts[1:n - k]
+    return (left, right)
+
+
+def elevate_degree(points):
+    """Control points of the same Bézier curve, one degree higher.
+
+    Works on homogeneous points too.
+    """
+    pts = np.asarray(points, dtype=np.float64)
+    n = len(pts)
+    if n == 0:
+        return pts.copy()
+    a = (np.arange(1, n) / n)[:, np.newaxis]
+    return np.vstack((pts[:1], a * pts[:-1] + (1.0 - a) * pts[1:], pts[-1:]))
 
 
 def combine_pairs(weights, points):
@@ -73,28 +167,14 @@ def combine_pairs(weights, points):
 
 
 def interpolateCurve(points):
+    from interpolation import BarycentricInterpolator
     step = 1.0 / (len(points) - 1)
-    xs = [pt[0] for pt in points]
-    ys = [pt[1] for pt in points]
-    xsInterp = interpolate(step, xs, [0.001 * t for t in range(1001)])
-    ysInterp = interpolate(step, ys, [0.001 * t for t in range(1001)])
-    return [(xsInterp[i], ysInterp[i]) for i in range(1001)]
+    grid = [0.001 * t for t in range(1001)]
+    interpolator = BarycentricInterpolator(step * np.arange(len(points)))
+    return [tuple(pt) for pt in interpolator.evaluate(points, grid).tolist()]
 
 
 def interpolate(step, ys, points):
-    N = len(ys)
-    diffquot = ys
-    print(ys)
-    for n in range(2, N + 1):
-        for k in range(N + 1 - n):
-            print(N - k - 1)
-            diffquot[N - 1 - k] = diffquot[N - 1 - k] - diffquot[N - k - 2]
-            diffquot[N - 1 - k] /= ((n - 1) * step)
-
-    result = []
-    for pt in points:
-        res = diffquot[-1]
-        for i in range(2, N + 1):
-            res = res * (pt - (N - i) * step) + diffquot[-i]
-        result.append(res)
-    return result
+    from interpolation import BarycentricInterpolator
+    interpolator = BarycentricInterpolator(step * np.arange(len(ys)))
+    return interpolator.evaluate(ys, points).tolist()